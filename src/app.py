@@ -1,31 +1,76 @@
+import asyncio
+from contextlib import asynccontextmanager
+import json
 import os
+import time
 import uuid
-import shutil
+import zipfile
 from celery.result import AsyncResult
 from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import gradio as gr
 
 from src.config import (
+    STAGING_PATH,
     list_specific_folders,
     list_shared_folders,
     reset_specific_folders,
     reset_shared_folders
 )
+from src.attribute_index import answer_from_index
+from src.bulk_service import batch_status, start_archive_batch, start_directory_batch
+from src.cache_service import cache_stats
 from src.chroma_service import (
-    add_to_specific,
-    add_to_shared,
     delete_specific,
     delete_shared,
-    query_chroma
+    query_chroma,
+    query_chroma_batch,
+    retrieval_stats
+)
+from src.model_service import (
+    MODEL_WARMUP,
+    model_predict,
+    model_predict_batch,
+    model_predict_stream,
+    model_status,
+    prefix_cache,
+    scheduler,
+    warm_up
+)
+from src.inference_service import (
+    QueueFullError,
+    Slot,
+    inference_status,
+    run_inference
+)
+from src.ingest_pipeline import load_metrics
+from src.ingest_service import delete_source, index_saved, move_source
+from src.manifest_service import write_stream
+from src.pipeline_profiles import resolve_options
+from src.rerank_service import RERANK, rerank_stats
+from src.task import (
+    celery_app,
+    cleanup_staging,
+    process_specific_task,
+    process_shared_task,
+    rebuild_task,
+    reindex_task
 )
-from src.model_service import model_predict
-from src.file_service import process_specific_upload, process_shared_upload
-from src.task import celery_app, process_specific_task, process_shared_task
 
 os.environ["JPYPE_JVM_OPTIONS"] = "--enable-native-access=ALL-UNNAMED"
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the API only needs the LLM stack; the Celery worker never calls warm_up
+    if MODEL_WARMUP != "off":
+        warm_up(
+            ["encoding", "embedder", "tokenizer", "model"] + (["reranker"] if RERANK else []),
+            background=(MODEL_WARMUP == "background")
+        )
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 # ---------------- FastAPI Endpoints ----------------
 def success_response(msg: str = None, data: dict = None):
@@ -40,30 +85,86 @@ def error_response(msg: str, status_code: int = 400):
     detail = [{"msg": msg, "type": "error"}]
     return JSONResponse(content={"detail": detail}, status_code=status_code)
 
-def file_to_tmp(file: UploadFile, job_id: str) -> str:
-    file_path = f"/tmp/{job_id}_{file.filename}"
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return file_path
+def stage_upload(file: UploadFile, job_id: str) -> tuple[str, str]:
+    # staged on the same filesystem as the upload folders so the worker can
+    # rename the file into place instead of copying it
+    staging_dir = STAGING_PATH / job_id
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    file_path = staging_dir / os.path.basename(file.filename)
+    digest = write_stream(file.file, file_path)
+    return str(file_path), digest
 
 @app.post("/upload_specific_file")
-async def upload_specific_file(file: UploadFile = File(...)):
+async def upload_specific_file(
+    file: UploadFile = File(...),
+    table_mode: str = Form(""),
+    ocr: str = Form(""),
+):
     if not file:
         return error_response("No documents attached.", status_code=400)
+    try:
+        options = resolve_options(table_mode or None, ocr or None)
+    except ValueError as e:
+        return error_response(str(e), status_code=400)
     job_id = str(uuid.uuid4())
-    file_path = file_to_tmp(file, job_id)
-    process_specific_task.apply_async(args=[file_path], task_id=job_id)
+    file_path, digest = await asyncio.to_thread(stage_upload, file, job_id)
+    process_specific_task.apply_async(args=[file_path, options, digest], task_id=job_id)
     return success_response(data={"job_id": job_id, "status": "PENDING", "result": None})
 
 @app.post("/upload_shared_file")
-async def upload_shared_file(file: UploadFile = File(...)):
+async def upload_shared_file(
+    file: UploadFile = File(...),
+    table_mode: str = Form(""),
+    ocr: str = Form(""),
+):
     if not file:
         return error_response("No documents attached.", status_code=400)
+    try:
+        options = resolve_options(table_mode or None, ocr or None)
+    except ValueError as e:
+        return error_response(str(e), status_code=400)
     job_id = str(uuid.uuid4())
-    file_path = file_to_tmp(file, job_id)    
-    process_shared_task.apply_async(args=[file_path], task_id=job_id)
+    file_path, digest = await asyncio.to_thread(stage_upload, file, job_id)
+    process_shared_task.apply_async(args=[file_path, options, digest], task_id=job_id)
     return success_response(data={"job_id": job_id, "status": "PENDING", "result": None})
 
+@app.post("/upload_bulk")
+async def upload_bulk(
+    file: UploadFile = File(None),
+    directory: str = Form(""),
+    collection: str = Form("specific"),
+    table_mode: str = Form(""),
+    ocr: str = Form(""),
+):
+    if collection not in ("specific", "shared"):
+        return error_response(f"Unknown collection: {collection}", status_code=400)
+    if not file and not directory:
+        return error_response("Attach a ZIP file or give a directory.", status_code=400)
+    try:
+        options = resolve_options(table_mode or None, ocr or None)
+        if file:
+            archive_path, _ = await asyncio.to_thread(stage_upload, file, str(uuid.uuid4()))
+            try:
+                batch_id = await asyncio.to_thread(start_archive_batch, archive_path, collection, options)
+            except Exception:
+                # the batch deletes the archive once it is done; nothing was queued
+                cleanup_staging(archive_path)
+                raise
+        else:
+            batch_id = await asyncio.to_thread(start_directory_batch, directory, collection, options)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return error_response(str(e), status_code=400)
+    except Exception as e:
+        return error_response(str(e), status_code=500)
+    return success_response(data={"batch_id": batch_id, "status": "PENDING"})
+
+@app.get("/batch_status/{batch_id}")
+async def get_batch_status(batch_id: str):
+    try:
+        return success_response(data=await asyncio.to_thread(batch_status, batch_id))
+    except ValueError as e:
+        return error_response(str(e), status_code=404)
+
 @app.get("/status/{job_id}")
 async def get_status(job_id: str):
     result = AsyncResult(job_id, app=celery_app)
@@ -74,6 +175,25 @@ async def get_status(job_id: str):
     }
     return success_response(data=data)
 
+@app.get("/model_status")
+async def get_model_status():
+    return success_response(data={
+        "loaded": model_status(),
+        "prefix_cache": prefix_cache.stats(),
+        "inference": inference_status(),
+        "scheduler": scheduler.stats(),
+        "retrieval": retrieval_stats.stats(),
+        "rerank": rerank_stats()
+    })
+
+@app.get("/cache_status")
+async def get_cache_status():
+    return success_response(data=cache_stats())
+
+@app.get("/ingest_metrics")
+async def get_ingest_metrics():
+    return success_response(data=load_metrics())
+
 @app.get("/list_specific")
 async def list_specific():
     return success_response(data={"files": list_specific_folders()})
@@ -100,6 +220,60 @@ async def reset_shared():
     except Exception as e:
         return error_response(str(e), status_code=500)
 
+@app.get("/rebuild_specific")
+async def rebuild_specific():
+    job_id = str(uuid.uuid4())
+    rebuild_task.apply_async(args=["specific"], task_id=job_id)
+    return success_response(data={"job_id": job_id, "status": "PENDING", "result": None})
+
+@app.get("/rebuild_shared")
+async def rebuild_shared():
+    job_id = str(uuid.uuid4())
+    rebuild_task.apply_async(args=["shared"], task_id=job_id)
+    return success_response(data={"job_id": job_id, "status": "PENDING", "result": None})
+
+@app.post("/delete_document")
+async def delete_document(
+    source: str = Form(...),
+    collection: str = Form("specific"),
+):
+    try:
+        result = await asyncio.to_thread(delete_source, source, collection)
+    except ValueError as e:
+        return error_response(str(e), status_code=400)
+    return success_response(msg=f"Deleted {source} from {collection}", data=result)
+
+@app.post("/reindex_document")
+async def reindex_document(
+    source: str = Form(...),
+    collection: str = Form("specific"),
+    table_mode: str = Form(""),
+    ocr: str = Form(""),
+):
+    if collection not in ("specific", "shared"):
+        return error_response(f"Unknown collection: {collection}", status_code=400)
+    try:
+        resolve_options(table_mode or None, ocr or None)
+    except ValueError as e:
+        return error_response(str(e), status_code=400)
+    # options left out are the ones the document was indexed with
+    options = {key: value for key, value in (("table_mode", table_mode), ("ocr", ocr)) if value}
+    job_id = str(uuid.uuid4())
+    reindex_task.apply_async(args=[source, collection, options], task_id=job_id)
+    return success_response(data={"job_id": job_id, "status": "PENDING", "result": None})
+
+@app.post("/move_document")
+async def move_document(
+    source: str = Form(...),
+    from_collection: str = Form(...),
+    to_collection: str = Form(...),
+):
+    try:
+        result = await asyncio.to_thread(move_source, source, from_collection, to_collection)
+    except ValueError as e:
+        return error_response(str(e), status_code=400)
+    return success_response(msg=f"Moved {source} to {to_collection}", data=result)
+
 @app.post("/ask_question")
 async def ask_question(
     manufacturer: str = Form(""),
@@ -107,64 +281,136 @@ async def ask_question(
     query_attr: str = Form(...),
 ):
     try:
-        hits = query_chroma(manufacturer, model_number, query_attr)
+        started = time.perf_counter()
+        indexed = await asyncio.to_thread(answer_from_index, manufacturer, model_number, query_attr)
+        if indexed:
+            seconds = {"lookup": round(time.perf_counter() - started, 3)}
+            return success_response(data={"answer": indexed, "hits": "", "from_index": True, "seconds": seconds})
+
+        hits = await asyncio.to_thread(query_chroma, manufacturer, model_number, query_attr)
+        retrieved = time.perf_counter()
         if len(hits) == 0:
             return success_response(data={"answer": "No relevant information found in the documents.", "hits": hits})
         
-        answer = model_predict(manufacturer, model_number, query_attr, hits)
-        return success_response(data={"answer": answer, "hits": hits})
+        answer = await run_inference(model_predict, manufacturer, model_number, query_attr, hits)
+        seconds = {
+            "retrieval": round(retrieved - started, 3),
+            "generation": round(time.perf_counter() - retrieved, 3),
+        }
+        return success_response(data={"answer": answer, "hits": hits, "seconds": seconds})
+    except QueueFullError as e:
+        return error_response(str(e), status_code=429)
+    except TimeoutError:
+        return error_response("Inference timed out.", status_code=503)
     except Exception as e:
         return error_response(str(e), status_code=500)
 
-# ---------------- Gradio UI ----------------
-def gr_sp_upload(files) -> tuple[str, None]:
-    results = []
-    if not files:
-        return "⚠️ No files uploaded", None
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    for f in files:
-        try:
-            with open(f.name, "rb") as fh:
-                upload_file = UploadFile(
-                    filename=os.path.basename(f.name),
-                    file=fh
-                )
-                documents = process_specific_upload(upload_file)
-
-                if documents:
-                    add_to_specific(documents)
-                    results.append(f"Uploaded & Indexed {upload_file.filename}")
-                else:
-                    results.append(f"No documents extracted from {upload_file.filename}")
-        except Exception as e:
-            results.append(f"Error processing {f.name}: {e}")
+def stream_answer(manufacturer: str, model_number: str, query_attr: str, slot: Slot):
+    try:
+        indexed = answer_from_index(manufacturer, model_number, query_attr)
+        if indexed:
+            yield sse_event("done", indexed)
+            return
 
-    return "\n".join(results), None
+        hits = query_chroma(manufacturer, model_number, query_attr)
+        yield sse_event("hits", hits)
+        if len(hits) == 0:
+            yield sse_event("done", "No relevant information found in the documents.")
+            return
 
-def gr_sh_upload(files) -> tuple[str, None]:
+        answer = ""
+        for delta in model_predict_stream(manufacturer, model_number, query_attr, hits):
+            answer += delta
+            yield sse_event("token", delta)
+        yield sse_event("done", answer or "No final message found")
+    except Exception as e:
+        yield sse_event("error", str(e))
+    finally:
+        slot.release()
+
+@app.post("/ask_question_stream")
+async def ask_question_stream(
+    manufacturer: str = Form(""),
+    model_number: str = Form(""),
+    query_attr: str = Form(...),
+):
+    try:
+        slot = Slot()
+    except QueueFullError as e:
+        return error_response(str(e), status_code=429)
+    return StreamingResponse(
+        stream_answer(manufacturer, model_number, query_attr, slot),
+        media_type="text/event-stream",
+        background=BackgroundTask(slot.release)
+    )
+
+@app.post("/ask_questions")
+async def ask_questions(
+    manufacturer: str = Form(""),
+    model_number: str = Form(""),
+    query_attrs: list[str] = Form(...),
+):
+    query_attrs = list(dict.fromkeys(a.strip() for a in query_attrs if a.strip()))
+    if not query_attrs:
+        return error_response("No attributes to query.", status_code=400)
+    try:
+        indexed = {}
+        for attr in query_attrs:
+            answer = await asyncio.to_thread(answer_from_index, manufacturer, model_number, attr)
+            if answer:
+                indexed[attr] = answer
+        remaining = [attr for attr in query_attrs if attr not in indexed]
+        if not remaining:
+            return success_response(data={"answers": indexed, "hits": "", "from_index": list(indexed)})
+
+        hits = await asyncio.to_thread(query_chroma_batch, manufacturer, model_number, remaining)
+        if len(hits) == 0:
+            answers = {
+                attr: indexed.get(attr, "No relevant information found in the documents.")
+                for attr in query_attrs
+            }
+            return success_response(data={"answers": answers, "hits": hits, "from_index": list(indexed)})
+
+        answers = await run_inference(model_predict_batch, manufacturer, model_number, remaining, hits)
+        answers = {attr: indexed.get(attr) or answers[attr] for attr in query_attrs}
+        return success_response(data={"answers": answers, "hits": hits, "from_index": list(indexed)})
+    except QueueFullError as e:
+        return error_response(str(e), status_code=429)
+    except TimeoutError:
+        return error_response("Inference timed out.", status_code=503)
+    except Exception as e:
+        return error_response(str(e), status_code=500)
+
+# ---------------- Gradio UI ----------------
+def gr_upload(files, name: str) -> tuple[str, None]:
     results = []
     if not files:
         return "⚠️ No files uploaded", None
 
     for f in files:
+        filename = os.path.basename(f.name)
         try:
-            with open(f.name, "rb") as fh:
-                upload_file = UploadFile(
-                    filename=os.path.basename(f.name),
-                    file=fh
-                )
-                documents = process_shared_upload(upload_file)
-
-                if documents:
-                    add_to_shared(documents)
-                    results.append(f"Uploaded & Indexed {upload_file.filename}")
-                else:
-                    results.append(f"No documents extracted from {upload_file.filename}")
+            result = index_saved(f.name, name)
+            if result["already_indexed"]:
+                results.append(f"Already indexed {filename}, skipped")
+            else:
+                results.append(f"Uploaded & Indexed {filename}")
+        except ValueError:
+            results.append(f"No documents extracted from {filename}")
         except Exception as e:
             results.append(f"Error processing {f.name}: {e}")
 
     return "\n".join(results), None
 
+def gr_sp_upload(files) -> tuple[str, None]:
+    return gr_upload(files, "specific")
+
+def gr_sh_upload(files) -> tuple[str, None]:
+    return gr_upload(files, "shared")
+
 def gr_sp_reset() -> tuple[str, str]:
     try:
         reset_result = reset_specific_folders()
@@ -181,16 +427,32 @@ def gr_sh_reset() -> tuple[str, str]:
     except Exception as e:
         return f"Reset failed: {e}", ""
 
-def gr_ask(manufacturer, model_number, query_attr) -> tuple[str, str]:
+def gr_ask(manufacturer, model_number, query_attr):
     try:
+        slot = Slot()
+    except QueueFullError as e:
+        yield f"Busy: {e}", ""
+        return
+    try:
+        indexed = answer_from_index(manufacturer, model_number, query_attr)
+        if indexed:
+            yield indexed, "Answered from the attribute index."
+            return
+
         hits = query_chroma(manufacturer, model_number, query_attr)
         if len(hits) == 0:
-            return "No relevant information found in the documents.", ""
+            yield "No relevant information found in the documents.", ""
+            return
 
-        answer = model_predict(manufacturer, model_number, query_attr, hits)
-        return answer, hits
+        yield "", hits
+        answer = ""
+        for delta in model_predict_stream(manufacturer, model_number, query_attr, hits):
+            answer += delta
+            yield answer, hits
     except Exception as e:
-        return f"Error: {str(e)}", ""
+        yield f"Error: {str(e)}", ""
+    finally:
+        slot.release()
 
 with gr.Blocks() as demo:
     gr.Markdown("## File QA Demo\nUpload files → Query")
@@ -0,0 +1,155 @@
+from collections import defaultdict
+import json
+import os
+import re
+
+from src.identifiers import is_model, normalize_model
+from src.manifest_service import attributes_for, match_sources
+
+ATTRIBUTE_INDEX = os.getenv("ATTRIBUTE_INDEX", "1") == "1"
+# confidence of an exact label match, and of one that only differs by units
+EXACT_CONFIDENCE = 100
+NOISY_CONFIDENCE = 95
+# discount for a cell whose row or column was never tied to the model number
+UNCHECKED_PENALTY = 10
+# more distinct values than this means the label is too ambiguous to trust
+ATTRIBUTE_MAX_VALUES = 5
+# same discount the prompt tells the LLM to apply to the shared collection
+SHARED_PENALTY = 15
+
+# "- **Rated Load**: Value=500 kg; Max=800 kg" from pdf_service tables
+KV_LINE = re.compile(r"^\s*-?\s*\*\*(?P<label>[^*]+)\*\*:\s*(?P<pairs>.*)$")
+# "Rated Load, Value = 500 kg" from Docling's triplet table serializer
+TRIPLET = re.compile(r"^(?P<row>[^,=]+?),\s*(?P<col>[^=]+?)\s*=\s*(?P<value>.+)$")
+PLACEHOLDER_LABEL = re.compile(r"^(Row \d+|\(no label\))$")
+# unit tokens a label may carry without changing what it names; "min" is left
+# out on purpose since it is far more often "minimum" than "minutes"
+UNIT_TOKENS = {
+    "a", "bar", "c", "cm", "db", "dba", "f", "ft", "g", "h", "hz", "in", "k", "kg",
+    "khz", "km", "kn", "kpa", "kv", "kva", "kw", "l", "lb", "lbs", "m", "m2", "m3",
+    "ma", "mm", "mm2", "mpa", "mw", "n", "nm", "pa", "psi", "rpm", "s", "t", "v",
+    "va", "w",
+}
+
+def extract_cells(text: str) -> list[tuple[str, str, str]]:
+    """(row label, column label, value) cells of the tables in a chunk."""
+    cells = []
+    for line in text.splitlines():
+        match = KV_LINE.match(line)
+        if match:
+            label = match["label"].strip()
+            label = "" if PLACEHOLDER_LABEL.match(label) else label
+            for pair in match["pairs"].split(";"):
+                key, sep, value = pair.partition("=")
+                if sep and value.strip():
+                    cells.append((label, key.strip(), value.strip()))
+            continue
+        for part in re.split(r"\.\s+", line):
+            match = TRIPLET.match(part.strip())
+            if match:
+                cells.append((match["row"].strip(), match["col"].strip(), match["value"].strip().rstrip(".")))
+    return cells
+
+def chunk_cells(batch: list) -> list[tuple[str, str, str, str, str, str]]:
+    return [
+        (row, col, value, chunk.metadata.get("pages", "[]"), label_key(row), label_key(col))
+        for chunk in batch
+        for row, col, value in extract_cells(chunk.page_content)
+    ]
+
+def normalize_label(label: str) -> str:
+    # units and footnotes in brackets do not change what is being asked
+    label = re.sub(r"[(\[].*?[)\]]", " ", label.lower())
+    return " ".join(re.findall(r"[a-z0-9]+", label))
+
+def singular(token: str) -> str:
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def label_key(label: str) -> str:
+    """
+    The words a label is made of, ignoring order, plurals, units and anything
+    in brackets. Two labels name the same attribute only when their keys are
+    equal, so "Max Operating Pressure" never matches "Min Operating Pressure".
+    """
+    tokens = {singular(token) for token in normalize_label(label).split() if token not in UNIT_TOKENS}
+    return " ".join(sorted(tokens))
+
+def labels_match(query_attr: str, label: str) -> bool:
+    key = label_key(query_attr)
+    return bool(key) and key == label_key(label)
+
+def first_page(pages: str) -> str:
+    try:
+        return str(json.loads(pages)[0])
+    except (ValueError, IndexError):
+        return "?"
+
+def find_matches(sources: set[str], query_attr: str, model_number: str) -> list[dict]:
+    key = label_key(query_attr)
+    if not key:
+        return []
+    wanted = normalize_label(query_attr)
+    model = normalize_model(model_number)
+    matches = []
+    for cell in attributes_for(sources, key):
+        # the attribute may be the row label with a column qualifier or the
+        # other way round, depending on how the table was laid out
+        if cell["row_key"] == key:
+            label, qualifier = cell["row_label"], cell["col_label"]
+        else:
+            label, qualifier = cell["col_label"], cell["row_label"]
+        qualifier_model = normalize_model(qualifier)
+        if model and is_model(qualifier_model) and not qualifier_model.startswith(model):
+            # a column of another model in a multi-model spec table
+            continue
+        exact = normalize_label(label) == wanted
+        matches.append({
+            **cell,
+            "confidence": EXACT_CONFIDENCE if exact else NOISY_CONFIDENCE,
+            "model_checked": not model or is_model(qualifier_model),
+        })
+
+    # a cell not tied to the model (a placeholder row, a "Value" column) is
+    # only trusted when its manual gives one value for the attribute; several
+    # values mean a multi-model table whose rows cannot be told apart
+    values = defaultdict(set)
+    for match in matches:
+        values[match["collection"], match["source"]].add(match["value"].lower())
+    checked = []
+    for match in matches:
+        if not match["model_checked"]:
+            if len(values[match["collection"], match["source"]]) > 1:
+                continue
+            match["confidence"] -= UNCHECKED_PENALTY
+        checked.append(match)
+    return checked
+
+def answer_from_index(manufacturer: str, model_number: str, query_attr: str) -> str | None:
+    """
+    Answer from the attribute index in the same format the LLM uses, or None
+    when there is no confident match and retrieval plus generation is needed.
+    """
+    if not ATTRIBUTE_INDEX:
+        return None
+    sources = match_sources(manufacturer, model_number)
+    # without a manufacturer or model number every manual would qualify
+    if not sources:
+        return None
+    matches = find_matches(sources, query_attr, model_number)
+
+    best = {}
+    for match in matches:
+        confidence = match["confidence"] - (SHARED_PENALTY if match["collection"] == "shared" else 0)
+        key = match["value"].lower()
+        if key not in best or confidence > best[key][0]:
+            best[key] = (confidence, match)
+    if not best or len(best) > ATTRIBUTE_MAX_VALUES:
+        return None
+
+    ranked = sorted(best.values(), key=lambda item: item[0], reverse=True)
+    return "\n".join(
+        f"{match['value']} ({confidence}%) [Ref: {match['source']} page {first_page(match['pages'])}]"
+        for confidence, match in ranked
+    )
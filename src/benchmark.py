@@ -0,0 +1,45 @@
+import argparse
+import time
+
+from src.file_service import convert_segments, plan_segments
+from src.pipeline_profiles import PIPELINE_PROFILES, TABLE_MODES, detect_device
+from src.text_layer import count_pages
+
+def benchmark_profile(files: list[str], profile: str, table_mode: str, ocr: str) -> dict:
+    pages = 0
+    started = time.perf_counter()
+    for file_path in files:
+        convert_segments(file_path, table_mode, plan_segments(file_path, ocr), profile)
+        pages += count_pages(file_path)
+    elapsed = time.perf_counter() - started
+    return {
+        "profile": profile,
+        "table_mode": table_mode,
+        "ocr": ocr,
+        "pages": pages,
+        "seconds": round(elapsed, 1),
+        "pages_per_sec": round(pages / elapsed, 2) if elapsed else 0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Report Docling pages/sec per pipeline profile.")
+    parser.add_argument("files", nargs="+", help="PDF files to convert")
+    parser.add_argument("--profiles", nargs="+", default=[detect_device()], choices=list(PIPELINE_PROFILES))
+    parser.add_argument("--table-modes", nargs="+", default=list(TABLE_MODES), choices=list(TABLE_MODES))
+    parser.add_argument("--ocr", nargs="+", default=["auto"], choices=["auto", "always", "never"])
+    args = parser.parse_args()
+
+    for profile in args.profiles:
+        for table_mode in args.table_modes:
+            for ocr in args.ocr:
+                # first pass loads the models, only the second one is timed
+                first = args.files[0]
+                convert_segments(first, table_mode, plan_segments(first, ocr), profile)
+                result = benchmark_profile(args.files, profile, table_mode, ocr)
+                print(
+                    f"{result['profile']:<5} {result['table_mode']:<9} ocr={result['ocr']:<7} "
+                    f"{result['pages']} pages in {result['seconds']}s -> {result['pages_per_sec']} pages/sec"
+                )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+from collections import Counter
+import json
+import os
+from pathlib import Path
+import time
+import uuid
+import zipfile
+from celery import chain, chord, group
+from celery.result import AsyncResult
+
+from src.config import BATCH_PATH, BULK_IMPORT_PATH
+from src.task import celery_app, cleanup_batch_task, process_archive_member_task, process_file_task
+
+# files of one batch converted at the same time; the rest wait in their lane
+# so a large batch does not take every worker process from single uploads
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "2"))
+
+def list_archive_pdfs(archive_path: str) -> list[str]:
+    with zipfile.ZipFile(archive_path) as archive:
+        return [
+            info.filename for info in archive.infolist()
+            if not info.is_dir()
+            and info.filename.lower().endswith(".pdf")
+            and not Path(info.filename).name.startswith(".")
+        ]
+
+def list_directory_pdfs(directory: str) -> list[str]:
+    root = BULK_IMPORT_PATH.resolve()
+    path = Path(directory).resolve()
+    if path != root and root not in path.parents:
+        raise ValueError(f"Directory must be inside {BULK_IMPORT_PATH}")
+    if not path.is_dir():
+        raise ValueError(f"Not a directory: {directory}")
+    return sorted(str(p) for p in path.rglob("*") if p.is_file() and p.suffix.lower() == ".pdf")
+
+def source_names(paths: list[str]) -> list[str]:
+    """
+    The file name each of ``paths`` is indexed under. Sources are keyed by
+    file name alone, so a name used in more than one folder of the batch
+    gets its folders prefixed instead of being taken as a revision of the
+    other file.
+    """
+    counts = Counter(Path(p).name for p in paths)
+    names = [
+        Path(p).name if counts[Path(p).name] == 1 else "_".join(Path(p).parts)
+        for p in paths
+    ]
+    if len(set(names)) != len(names):
+        duplicates = sorted(name for name, count in Counter(names).items() if count > 1)
+        raise ValueError(f"Duplicate file names in the batch: {', '.join(duplicates)}")
+    return names
+
+def batch_lanes(signatures: list, lanes: int) -> list:
+    """Spread ``signatures`` over at most ``lanes`` chains that run side by side."""
+    lanes = max(1, min(lanes, len(signatures)))
+    return [chain(signatures[i::lanes]) for i in range(lanes)]
+
+def start_batch(signatures: list, files: list[str], name: str, archive_path: str = None) -> str:
+    # each task reports its own failure, so a chain always moves on to the next file
+    lanes = batch_lanes(signatures, BULK_CONCURRENCY)
+    if archive_path:
+        chord(lanes)(cleanup_batch_task.si(archive_path))
+    else:
+        group(lanes).apply_async()
+
+    batch_id = str(uuid.uuid4())
+    batch = {
+        "batch_id": batch_id,
+        "collection": name,
+        "started_at": time.time(),
+        "files": [{"file": f, "task_id": s.id} for f, s in zip(files, signatures)],
+    }
+    (BATCH_PATH / f"{batch_id}.json").write_text(json.dumps(batch))
+    return batch_id
+
+def start_archive_batch(archive_path: str, name: str, options: dict) -> str:
+    members = list_archive_pdfs(archive_path)
+    if not members:
+        raise ValueError("No PDF files found in the archive")
+    signatures = [
+        process_archive_member_task.si(archive_path, member, name, options, filename)
+        .set(task_id=str(uuid.uuid4()))
+        for member, filename in zip(members, source_names(members))
+    ]
+    return start_batch(signatures, members, name, archive_path)
+
+def start_directory_batch(directory: str, name: str, options: dict) -> str:
+    files = list_directory_pdfs(directory)
+    if not files:
+        raise ValueError("No PDF files found in the directory")
+    root = Path(directory).resolve()
+    relative = [str(Path(file_path).relative_to(root)) for file_path in files]
+    signatures = [
+        process_file_task.si(file_path, name, options, filename).set(task_id=str(uuid.uuid4()))
+        for file_path, filename in zip(files, source_names(relative))
+    ]
+    return start_batch(signatures, files, name)
+
+def batch_status(batch_id: str) -> dict:
+    batch_file = BATCH_PATH / f"{Path(batch_id).name}.json"
+    if not batch_file.exists():
+        raise ValueError(f"Unknown batch: {batch_id}")
+    batch = json.loads(batch_file.read_text())
+
+    done, failed, skipped, pages = 0, [], 0, 0
+    for entry in batch["files"]:
+        result = AsyncResult(entry["task_id"], app=celery_app)
+        if not result.ready():
+            continue
+        value = result.result if isinstance(result.result, dict) else {}
+        if result.failed() or value.get("status") == "failed":
+            failed.append({"file": entry["file"], "error": value.get("error", str(result.result))})
+            continue
+        done += 1
+        if value.get("already_indexed"):
+            # nothing was converted, so these would inflate pages_per_sec
+            skipped += 1
+        else:
+            pages += value.get("pages", 0)
+
+    total = len(batch["files"])
+    finished = done + len(failed)
+    elapsed = time.time() - batch["started_at"]
+    eta = elapsed / finished * (total - finished) if finished else None
+    return {
+        "batch_id": batch_id,
+        "collection": batch["collection"],
+        "total": total,
+        "done": done,
+        "already_indexed": skipped,
+        "failed": failed,
+        "pending": total - finished,
+        "pages": pages,
+        "pages_per_sec": round(pages / elapsed, 2) if elapsed else 0,
+        "elapsed_seconds": round(elapsed, 1),
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+    }
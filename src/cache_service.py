@@ -0,0 +1,207 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from src.config import CACHE_PATH, CHROMA_PATH, REDIS_URL
+
+QUERY_CACHE_BACKEND = os.getenv("QUERY_CACHE_BACKEND", "memory")  # memory | disk | redis | off
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "86400"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+
+VERSION_PATH = CHROMA_PATH / "versions"
+VERSION_PATH.mkdir(parents=True, exist_ok=True)
+
+_redis = None
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(REDIS_URL)
+    return _redis
+
+# ---------------- Collection versions ----------------
+# The Celery worker writes to Chroma while the API reads from it, so the
+# version counters live outside the process (Redis or a file next to Chroma).
+def get_version(name: str) -> int:
+    if QUERY_CACHE_BACKEND == "redis":
+        value = get_redis().get(f"bim:version:{name}")
+        return int(value) if value else 0
+    version_file = VERSION_PATH / name
+    try:
+        return int(version_file.read_text())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def bump_version(name: str) -> int:
+    if QUERY_CACHE_BACKEND == "redis":
+        return int(get_redis().incr(f"bim:version:{name}"))
+    version = get_version(name) + 1
+    tmp_file = VERSION_PATH / f".{name}.{os.getpid()}"
+    tmp_file.write_text(str(version))
+    os.replace(tmp_file, VERSION_PATH / name)
+    return version
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+# ---------------- Backends ----------------
+class MemoryBackend:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class DiskBackend:
+    def __init__(self, namespace: str, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(CACHE_PATH / f"{namespace}.sqlite3", check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT, expires REAL, used REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def set(self, key: str, value, ttl: int):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now)
+            )
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+class RedisBackend:
+    def __init__(self, namespace: str):
+        self.prefix = f"bim:cache:{namespace}:"
+
+    def get(self, key: str):
+        value = get_redis().get(self.prefix + key)
+        return json.loads(value) if value else None
+
+    def set(self, key: str, value, ttl: int):
+        get_redis().setex(self.prefix + key, ttl, json.dumps(value))
+
+    def clear(self):
+        client = get_redis()
+        for key in client.scan_iter(match=self.prefix + "*"):
+            client.delete(key)
+
+def make_backend(namespace: str):
+    if QUERY_CACHE_BACKEND == "disk":
+        return DiskBackend(namespace, QUERY_CACHE_SIZE)
+    if QUERY_CACHE_BACKEND == "redis":
+        return RedisBackend(namespace)
+    return MemoryBackend(QUERY_CACHE_SIZE)
+
+# ---------------- Query cache ----------------
+class QueryCache:
+    def __init__(self, namespace: str, ttl: int = QUERY_CACHE_TTL):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.enabled = QUERY_CACHE_BACKEND != "off"
+        self.backend = make_backend(namespace) if self.enabled else None
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, *parts) -> str:
+        versions = f"{get_version('specific')}.{get_version('shared')}"
+        text = "|".join(normalize(str(p)) for p in parts)
+        return f"{versions}:{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"Cache {self.namespace} get failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value):
+        if not self.enabled:
+            return
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            print(f"Cache {self.namespace} set failed: {e}")
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
+
+    def stats(self) -> dict:
+        return {
+            "backend": QUERY_CACHE_BACKEND,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+retrieval_cache = QueryCache("retrieval")
+answer_cache = QueryCache("answer")
+
+def cache_stats() -> dict:
+    return {
+        "retrieval": retrieval_cache.stats(),
+        "answer": answer_cache.stats(),
+        "versions": {"specific": get_version("specific"), "shared": get_version("shared")},
+    }
@@ -1,27 +1,186 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import os
+import re
+import threading
+import time
+from typing import Iterable
 import chromadb
 from langchain_core.documents import Document
 
+from src import lexical_index
+from src.cache_service import bump_version, get_version, retrieval_cache
 from src.config import CHROMA_PATH
+from src.context_builder import (
+    CONTEXT_BATCH_TOKEN_BUDGET,
+    CONTEXT_TOKEN_BUDGET,
+    build_context,
+    count_tokens
+)
+from src.embedding_cache import EMBEDDING_CACHE, embedding_cache
+from src.inference_service import INFERENCE_WORKERS
+from src.manifest_service import forget_collection, match_sources
 from src.model_service import get_embedder
+from src.rerank_service import RERANK, RERANK_CANDIDATES, rerank
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# BM25 hits are fused with the vector hits by reciprocal rank
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+HYBRID_FETCH = int(os.getenv("HYBRID_FETCH", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# every question searches both collections at once
+CHROMA_QUERY_WORKERS = int(os.getenv("CHROMA_QUERY_WORKERS", str(2 * INFERENCE_WORKERS)))
 
 client = chromadb.PersistentClient(path=CHROMA_PATH)
+query_executor = ThreadPoolExecutor(max_workers=CHROMA_QUERY_WORKERS, thread_name_prefix="chroma-query")
+
+class RetrievalStats:
+    """Average latency per retrieval stage and context size, for uncached queries."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = Counter()
+        self.context_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: dict, context_tokens: int):
+        with self._lock:
+            self.queries += 1
+            self.seconds.update(seconds)
+            self.context_tokens += context_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            if not self.queries:
+                return {"queries": 0}
+            return {
+                "queries": self.queries,
+                "avg_seconds": {
+                    stage: round(total / self.queries, 4) for stage, total in self.seconds.items()
+                },
+                "avg_context_tokens": round(self.context_tokens / self.queries),
+            }
+
+retrieval_stats = RetrievalStats()
+
+_collections = {}
+_collections_lock = threading.Lock()
 
 def get_collection(name: str):
-    return client.get_or_create_collection(
-        name=name,
-        embedding_function=get_embedder()
+    # Chroma resolves a handle by collection UUID, so a handle cached here goes
+    # stale once the API or the worker deletes and recreates the collection.
+    # Every delete bumps the version, which makes the other process refetch.
+    version = get_version(name)
+    with _collections_lock:
+        cached = _collections.get(name)
+        if cached is None or cached[0] != version:
+            cached = (version, client.get_or_create_collection(
+                name=name,
+                embedding_function=get_embedder()
+            ))
+            _collections[name] = cached
+        return cached[1]
+
+def batched(chunks: Iterable[Document], size: int):
+    chunk_iter = iter(chunks)
+    while batch := list(islice(chunk_iter, size)):
+        yield batch
+
+def max_batch_size() -> int:
+    return max(1, min(EMBED_BATCH_SIZE, client.get_max_batch_size()))
+
+def embed_batch(batch: list[Document]) -> list:
+    if not EMBEDDING_CACHE:
+        return get_embedder()([chunk.page_content for chunk in batch])
+    # the same chunk text shows up in both collections, in rebuilds and in
+    # unchanged parts of revised manuals; only embed what was never seen
+    ids = [chunk.metadata["chunk_id"] for chunk in batch]
+    embeddings = embedding_cache.get_many(ids)
+    missing = [chunk for chunk in batch if chunk.metadata["chunk_id"] not in embeddings]
+    if missing:
+        vectors = get_embedder()([chunk.page_content for chunk in missing])
+        missing_ids = [chunk.metadata["chunk_id"] for chunk in missing]
+        embedding_cache.put_many(missing_ids, vectors)
+        embeddings.update(zip(missing_ids, (list(map(float, v)) for v in vectors)))
+    return [embeddings[cid] for cid in ids]
+
+def upsert_batch(name: str, batch: list[Document], embeddings: list) -> list[str]:
+    ids = [chunk.metadata.get("chunk_id") for chunk in batch]
+    get_collection(name).upsert(
+        ids=ids,
+        documents=[chunk.page_content for chunk in batch],
+        metadatas=[chunk.metadata for chunk in batch],
+        embeddings=embeddings
+    )
+    lexical_index.index_chunks(
+        name,
+        ids,
+        [chunk.page_content for chunk in batch],
+        [chunk.metadata.get("source") for chunk in batch]
     )
+    return ids
 
-def add_to_collection(chunks: list[Document], name: str):
+def copy_chunks(name: str, chunks: dict):
+    """Upsert chunks fetched from another collection, vectors included."""
     collection = get_collection(name)
-    collection.upsert(
-        documents=[chunk.page_content for chunk in chunks],
-        metadatas=[chunk.metadata for chunk in chunks],
-        ids=[chunk.metadata.get("chunk_id") for chunk in chunks]
+    rows = zip(chunks["ids"], chunks["embeddings"], chunks["documents"], chunks["metadatas"])
+    for batch in batched(rows, max_batch_size()):
+        ids, embeddings, documents, metadatas = zip(*batch)
+        collection.upsert(
+            ids=list(ids),
+            embeddings=list(embeddings),
+            documents=list(documents),
+            metadatas=list(metadatas)
+        )
+    lexical_index.index_chunks(
+        name,
+        chunks["ids"],
+        chunks["documents"],
+        [m.get("source") for m in chunks["metadatas"]]
+    )
+
+def existing_ids(name: str, ids: list[str]) -> set[str]:
+    return set(get_collection(name).get(ids=ids, include=[])["ids"])
+
+def update_metadata(name: str, batch: list[Document]):
+    get_collection(name).update(
+        ids=[chunk.metadata.get("chunk_id") for chunk in batch],
+        metadatas=[chunk.metadata for chunk in batch]
+    )
+    lexical_index.update_sources(
+        name,
+        [chunk.metadata.get("chunk_id") for chunk in batch],
+        [chunk.metadata.get("source") for chunk in batch]
     )
 
+def delete_chunks(name: str, ids: list[str]):
+    collection = get_collection(name)
+    for batch in batched(ids, max_batch_size()):
+        collection.delete(ids=batch)
+    lexical_index.remove_chunks(name, ids)
+    if ids:
+        bump_version(name)
+
+def source_chunks(name: str, source: str, include: list[str] = None) -> dict:
+    return get_collection(name).get(where={"source": source}, include=include or [])
+
+def collection_sources(name: str) -> set[str]:
+    collection = get_collection(name)
+    sources = set()
+    page = max_batch_size()
+    for offset in range(0, collection.count(), page):
+        metadatas = collection.get(include=["metadatas"], limit=page, offset=offset)["metadatas"]
+        sources.update(m.get("source") for m in metadatas if m.get("source"))
+    return sources
+
 def delete_collection(name: str):
-    client.delete_collection(name=name)
+    with _collections_lock:
+        _collections.pop(name, None)
+        client.delete_collection(name=name)
+    forget_collection(name)
+    lexical_index.forget_collection(name)
+    bump_version(name)
 
 def get_specific():
     return get_collection("specific")
@@ -29,71 +188,148 @@ def get_specific():
 def get_shared():
     return get_collection("shared")
 
-def add_to_specific(chunks: list[Document]):
-    add_to_collection(chunks, "specific")
-
-def add_to_shared(chunks: list[Document]):
-    add_to_collection(chunks, "shared")
-
 def delete_specific():
     delete_collection("specific")
 
 def delete_shared():
     delete_collection("shared")
 
+def build_query_text(manufacturer: str, model_number: str, query_attr: str) -> str:
+    query_parts = [manufacturer.strip(), model_number.strip(), query_attr.strip()]
+    return " ".join([q for q in query_parts if q])
+
+def build_document_filters(manufacturer: str, model_number: str) -> dict:
+    patterns = [f"(?i){re.escape(text.strip())}" for text in (manufacturer, model_number) if text.strip()]
+    if len(patterns) == 1:
+        return {"$regex": patterns[0]}
+    return {"$and": [{"$regex": pattern} for pattern in patterns]}
+
+def build_filters(manufacturer: str, model_number: str) -> dict | None:
+    """
+    Chroma filters for the manufacturer and model number: an exact source
+    filter from the identifier index, or the slower text scan for documents
+    the index does not know (yet), so those are not silently lost.
+    """
+    sources = match_sources(manufacturer, model_number)
+    if sources is None:
+        return None
+    if not sources:
+        return {"where_document": build_document_filters(manufacturer, model_number)}
+    return {"where": {"source": {"$in": sorted(sources)}}}
+
+def fuse_rankings(rankings: list[list[str]], k: int) -> list[str]:
+    scores = Counter()
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking):
+            scores[cid] += 1 / (RRF_K + rank + 1)
+    return [cid for cid, _ in scores.most_common(k)]
+
 def query_collection(
         collection: chromadb.Collection,
-        query_text: str,
-        filters: dict,
+        query_texts: list[str],
+        query_embeddings: list,
+        filters: dict | None,
         k: int = 5
-    ) -> str:
+    ) -> list[dict]:
+    # over-fetch from both retrievers so the fused top k has room to reorder
+    fetch = max(k, HYBRID_FETCH) if HYBRID_SEARCH else k
+    filters = filters or {}
     results = collection.query(
-        query_texts=[query_text],
-        n_results=k,
-        where_document=filters if filters else None,
+        query_embeddings=query_embeddings,
+        n_results=fetch,
+        where=filters.get("where"),
+        where_document=filters.get("where_document"),
     )
+    sources = set(filters["where"]["source"]["$in"]) if "where" in filters else None
+    # the lexical index cannot apply a text scan, so it sits out that fallback
+    use_lexical = HYBRID_SEARCH and "where_document" not in filters
 
-    documents = results["documents"][0]
-    metadatas = results["metadatas"][0]
-    # distances = results["distances"][0]
-    hits = "\n\n".join(
-        [
-            f"Ref: {m.get('source')} | pages: {m.get('pages')}\n"
-            f"{doc}"
-            for m, doc in zip(metadatas, documents)
-        ]
-    )
+    found = {}
+    ranked = []
+    for text, ids, metas, docs in zip(query_texts, results["ids"], results["metadatas"], results["documents"]):
+        found.update(zip(ids, zip(metas, docs)))
+        rankings = [ids]
+        if use_lexical:
+            rankings.append(lexical_index.search(collection.name, text, fetch, sources))
+        ranked.append(fuse_rankings(rankings, k))
+
+    missing = list(dict.fromkeys(cid for ids in ranked for cid in ids if cid not in found))
+    if missing:
+        extra = collection.get(ids=missing, include=["metadatas", "documents"])
+        found.update(zip(extra["ids"], zip(extra["metadatas"], extra["documents"])))
 
+    # attributes of one asset mostly hit the same chunks, so keep each chunk once
+    seen_ids = set()
+    hits = []
+    for ids in ranked:
+        for cid in ids:
+            if cid in found and cid not in seen_ids:
+                seen_ids.add(cid)
+                hits.append({"id": cid, "metadata": found[cid][0], "document": found[cid][1]})
     return hits
 
+def query_both(
+        query_texts: list[str],
+        query_attrs: list[str],
+        filters: dict | None,
+        k: int,
+        budget: int
+    ) -> str:
+    timings = {}
+    started = time.perf_counter()
+
+    # embed once, then hit both collections in parallel with the same vectors
+    query_embeddings = get_embedder()(query_texts)
+    timings["embed"] = time.perf_counter() - started
+
+    # with reranking on, over-fetch and let the cross-encoder pick the few kept
+    fetch = max(k, RERANK_CANDIDATES) if RERANK else k
+    specific_future = query_executor.submit(
+        query_collection, get_specific(), query_texts, query_embeddings, filters, fetch
+    )
+    shared_future = query_executor.submit(
+        query_collection, get_shared(), query_texts, query_embeddings, filters, fetch
+    )
+    specific_hits, shared_hits = specific_future.result(), shared_future.result()
+    timings["search"] = time.perf_counter() - started - sum(timings.values())
+
+    if RERANK:
+        specific_hits, shared_hits = rerank(query_texts, [specific_hits, shared_hits])
+        timings["rerank"] = time.perf_counter() - started - sum(timings.values())
+
+    context = build_context(specific_hits, shared_hits, query_attrs, budget)
+    timings["context"] = time.perf_counter() - started - sum(timings.values())
+    retrieval_stats.record(timings, count_tokens(context))
+    return context
+
 def query_chroma(manufacturer: str, model_number: str, query_attr: str, k: int = 5) -> str:    
-    query_parts = [manufacturer.strip(), model_number.strip(), query_attr.strip()]
-    query_text = " ".join([q for q in query_parts if q])
-    filters = {}
-    if manufacturer.strip():
-        filters["$regex"] = f"(?i){manufacturer.strip()}"
-    if model_number.strip():
-        if "$regex" in filters:
-            filters["$and"] = [
-                {"$regex": f"(?i){manufacturer.strip()}"},
-                {"$regex": f"(?i){model_number.strip()}"}
-            ]
-            filters.pop("$regex")
-        else:
-            filters["$regex"] = f"(?i){model_number.strip()}"
+    query_text = build_query_text(manufacturer, model_number, query_attr)
+    cache_key = retrieval_cache.make_key(manufacturer, model_number, query_attr, k, CONTEXT_TOKEN_BUDGET)
+    cached = retrieval_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    # the identifier lookups are only needed on a miss
+    filters = build_filters(manufacturer, model_number)
     print(f"Querying ChromaDB with text: {query_text} and filters: {filters}")
 
-    specific_hits = query_collection(get_specific(), query_text, filters, k)
-    shared_hits = query_collection(get_shared(), query_text, filters, k)
+    hits = query_both([query_text], [query_attr], filters, k, CONTEXT_TOKEN_BUDGET)
+    retrieval_cache.set(cache_key, hits)
+    return hits
 
-    if specific_hits and shared_hits:
-        return (
-            "\n\n=== PRIORITY: SPECIFIC COLLECTION ===\n\n" + specific_hits +
-            "\n\n=== FALLBACK: SHARED COLLECTION ===\n\n" + shared_hits
-        )
-    elif specific_hits:
-        return specific_hits
-    elif shared_hits:
-        return shared_hits
-    else:
-        return "Not Found"
\ No newline at end of file
+def query_chroma_batch(
+        manufacturer: str,
+        model_number: str,
+        query_attrs: list[str],
+        k: int = 3
+    ) -> str:
+    query_texts = [build_query_text(manufacturer, model_number, attr) for attr in query_attrs]
+    cache_key = retrieval_cache.make_key(manufacturer, model_number, *sorted(query_attrs), k, CONTEXT_BATCH_TOKEN_BUDGET)
+    cached = retrieval_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    filters = build_filters(manufacturer, model_number)
+    print(f"Querying ChromaDB with {len(query_texts)} texts and filters: {filters}")
+
+    hits = query_both(query_texts, query_attrs, filters, k, CONTEXT_BATCH_TOKEN_BUDGET)
+    retrieval_cache.set(cache_key, hits)
+    return hits
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 import shutil
 
@@ -11,7 +12,17 @@ SHARED_UPLOAD_PATH = BASE_PATH / "shared_upload"
 CHROMA_PATH = BASE_PATH / "chroma_db"
 OUTPUT_PATH = BASE_PATH / "output_files"
 
-ALL_PATHS = [SPECIFIC_UPLOAD_PATH, SHARED_UPLOAD_PATH, CHROMA_PATH, OUTPUT_PATH]
+CACHE_PATH = BASE_PATH / "cache"
+ARTIFACT_PATH = BASE_PATH / "artifacts"
+BATCH_PATH = CACHE_PATH / "batches"
+STAGING_PATH = BASE_PATH / "staging"
+# server-side directories accepted by /upload_bulk must live under this path
+BULK_IMPORT_PATH = Path(os.getenv("BULK_IMPORT_PATH", BASE_PATH / "bulk_import"))
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+ALL_PATHS = [SPECIFIC_UPLOAD_PATH, SHARED_UPLOAD_PATH, CHROMA_PATH, OUTPUT_PATH, CACHE_PATH, ARTIFACT_PATH,
+             BATCH_PATH, STAGING_PATH, BULK_IMPORT_PATH]
 
 for p in ALL_PATHS:
     p.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,97 @@
+import os
+import re
+
+from src.lexical_index import tokenize
+from src.model_service import get_tokenizer
+
+# prompt tokens spent on retrieved content, measured with the LLM tokenizer
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2048"))
+CONTEXT_BATCH_TOKEN_BUDGET = int(os.getenv("CONTEXT_BATCH_TOKEN_BUDGET", "4096"))
+# a hit that only partly fits is cut down rather than dropped, unless the
+# space left is too small to say anything useful
+MIN_PARTIAL_TOKENS = 64
+# lines longer than this are prose rather than table rows and get split into sentences
+LONG_LINE_CHARS = 300
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+SPECIFIC_HEADER = "=== PRIORITY: SPECIFIC COLLECTION ==="
+SHARED_HEADER = "=== FALLBACK: SHARED COLLECTION ==="
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer().encode(text, add_special_tokens=False))
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    tokenizer = get_tokenizer()
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    return tokenizer.decode(ids[:max_tokens])
+
+def segments(text: str) -> list[str]:
+    parts = []
+    for line in text.splitlines():
+        if len(line) > LONG_LINE_CHARS:
+            parts.extend(SENTENCE_SPLIT.split(line))
+        elif line.strip():
+            parts.append(line)
+    return parts
+
+def trim_chunk(text: str, terms: set[str]) -> str:
+    """
+    Keep only the table rows or sentences that mention one of ``terms``; a
+    chunk with no mention at all is kept whole since it was retrieved anyway.
+    """
+    if not terms:
+        return text
+    kept = [part for part in segments(text) if terms & set(tokenize(part))]
+    return "\n".join(kept) if kept else text
+
+def format_hit(hit: dict, text: str) -> str:
+    metadata = hit["metadata"]
+    return f"Ref: {metadata.get('source')} | pages: {metadata.get('pages')}\n{text}"
+
+def pack(hits: list[dict], terms: set[str], budget: int) -> tuple[list[str], int]:
+    packed = []
+    for hit in hits:
+        if budget <= 0:
+            break
+        block = format_hit(hit, trim_chunk(hit["document"], terms))
+        cost = count_tokens(block)
+        if cost > budget:
+            if budget >= MIN_PARTIAL_TOKENS:
+                packed.append(truncate_tokens(block, budget))
+            budget = 0
+            break
+        packed.append(block)
+        budget -= cost
+    return packed, budget
+
+def build_context(
+        specific_hits: list[dict],
+        shared_hits: list[dict],
+        query_attrs: list[str],
+        budget: int = CONTEXT_TOKEN_BUDGET
+) -> str:
+    """
+    Assemble the document content for the prompt from hits already in
+    relevance order. Specific hits are packed before shared ones, a chunk
+    found in both collections is only sent once, and packing stops when
+    ``budget`` tokens are used.
+    """
+    specific_ids = {hit["id"] for hit in specific_hits}
+    shared_hits = [hit for hit in shared_hits if hit["id"] not in specific_ids]
+    terms = {term for attr in query_attrs for term in tokenize(attr)}
+
+    if specific_hits and shared_hits:
+        budget -= count_tokens(SPECIFIC_HEADER) + count_tokens(SHARED_HEADER)
+    specific, budget = pack(specific_hits, terms, budget)
+    shared, _ = pack(shared_hits, terms, budget)
+
+    if specific and shared:
+        return (
+            f"\n\n{SPECIFIC_HEADER}\n\n" + "\n\n".join(specific) +
+            f"\n\n{SHARED_HEADER}\n\n" + "\n\n".join(shared)
+        )
+    elif specific or shared:
+        return "\n\n".join(specific or shared)
+    else:
+        return "Not Found"
@@ -0,0 +1,123 @@
+import fcntl
+import os
+from pathlib import Path
+import re
+import sqlite3
+import threading
+import numpy as np
+
+from src.config import CACHE_PATH
+from src.model_service import EMBEDDER_MODEL
+
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") == "1"
+
+class EmbeddingCache:
+    """
+    Chunk embeddings of one model, keyed by the md5 chunk id. Vectors are
+    appended to a float32 matrix file that is read through a memory map; a
+    SQLite index maps each chunk id to its row. Several Celery workers may
+    append at once, so appends hold an exclusive lock on the matrix file.
+    """
+
+    def __init__(self, model_name: str, path: Path):
+        path.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.vectors_path = path / "vectors.f32"
+        self.vectors_path.touch(exist_ok=True)
+        self._conn = sqlite3.connect(path / "index.sqlite3", check_same_thread=False, timeout=30)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rows (chunk_id TEXT PRIMARY KEY, row INTEGER)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._matrix = None
+        self.hits = 0
+        self.misses = 0
+
+    def dimension(self) -> int | None:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dimension'").fetchone()
+        return int(row[0]) if row else None
+
+    def next_row(self) -> int:
+        # the index, not the file size, says which rows were fully written
+        row = self._conn.execute("SELECT MAX(row) FROM rows").fetchone()[0]
+        return 0 if row is None else row + 1
+
+    def matrix(self, dimension: int, rows_needed: int) -> np.ndarray:
+        # remap once other writers have grown the file past what we mapped
+        if self._matrix is None or self._matrix.shape[0] < rows_needed:
+            rows = self.next_row()
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, dimension))
+        return self._matrix
+
+    def get_many(self, ids: list[str]) -> dict[str, list[float]]:
+        with self._lock:
+            dimension = self.dimension()
+            if dimension is None or not ids:
+                self.misses += len(ids)
+                return {}
+            found = {}
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                found.update(self._conn.execute(
+                    f"SELECT chunk_id, row FROM rows WHERE chunk_id IN ({', '.join('?' * len(batch))})",
+                    batch
+                ).fetchall())
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+            if not found:
+                return {}
+            matrix = self.matrix(dimension, max(found.values()) + 1)
+            return {cid: matrix[row].tolist() for cid, row in found.items()}
+
+    def put_many(self, ids: list[str], vectors: list) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not ids:
+            return
+        with self._lock, open(self.vectors_path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                dimension = self.dimension()
+                if dimension is None:
+                    dimension = vectors.shape[1]
+                    self._conn.execute(
+                        "INSERT INTO meta VALUES ('dimension', ?)", (str(dimension),)
+                    )
+                known = set()
+                for i in range(0, len(ids), 500):
+                    batch = ids[i:i + 500]
+                    known.update(cid for (cid,) in self._conn.execute(
+                        f"SELECT chunk_id FROM rows WHERE chunk_id IN ({', '.join('?' * len(batch))})",
+                        batch
+                    ))
+                first = {cid: i for i, cid in reversed(list(enumerate(ids)))}
+                keep = [i for cid, i in first.items() if cid not in known]
+                # drop whatever a writer that died before committing left behind,
+                # so the new rows land where the index will say they are
+                first_row = self.next_row()
+                os.ftruncate(f.fileno(), first_row * dimension * 4)
+                f.write(vectors[keep].tobytes())
+                f.flush()
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO rows VALUES (?, ?)",
+                    [(ids[i], first_row + n) for n, i in enumerate(keep)]
+                )
+                self._conn.commit()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "vectors": rows,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            }
+
+def cache_dir(model_name: str) -> Path:
+    return CACHE_PATH / "embeddings" / re.sub(r"[^A-Za-z0-9._-]", "_", model_name)
+
+embedding_cache = EmbeddingCache(EMBEDDER_MODEL, cache_dir(EMBEDDER_MODEL))
@@ -1,21 +1,22 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import gzip
 import hashlib
+from multiprocessing import get_context
 import os
 from pathlib import Path
 import shutil
+import threading
+import zipfile
 from docling.chunking import HybridChunker, DocChunk
-from docling.datamodel.accelerator_options import AcceleratorDevice, AcceleratorOptions
-from docling.datamodel.base_models import InputFormat
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.datamodel.pipeline_options import (
-    ThreadedPdfPipelineOptions,
-    RapidOcrOptions,
-    TableFormerMode
-)
-from fastapi import UploadFile
+from docling_core.types.doc import DoclingDocument
 from langchain_core.documents import Document
 from transformers import AutoTokenizer
 
-from src.config import SPECIFIC_UPLOAD_PATH, SHARED_UPLOAD_PATH
+from src.config import ARTIFACT_PATH
+from src.manifest_service import file_sha256, write_stream
+from src.pipeline_profiles import get_converter, resolve_options
+from src.text_layer import count_pages, is_pdf, page_runs, scanned_pages
 
 env = os.getenv("APP_ENV")
 if env == "prod":
@@ -26,21 +27,12 @@ if env == "prod":
 MODEL_NAME = "bert-base-uncased"
 MAX_TOKENS = 1024
 
-pipeline_options = ThreadedPdfPipelineOptions(
-    accelerator_options=AcceleratorOptions(device=AcceleratorDevice.CUDA),
-    ocr_batch_size=4,
-    layout_batch_size=64,
-    table_batch_size=4,
-    do_table_structure=True
-)
-pipeline_options.table_structure_options.do_cell_matching = False
-pipeline_options.table_structure_options.mode = TableFormerMode.ACCURATE
-pipeline_options.ocr_options = RapidOcrOptions(backend="torch")
-converter = DocumentConverter(
-    format_options={
-        InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
-    }
-)
+# Large manuals are converted in page windows across worker processes
+PAGE_WINDOW = int(os.getenv("PAGE_WINDOW", "50"))
+PAGE_WORKERS = int(os.getenv("PAGE_WORKERS", "1"))
+# the workers share the cores instead of each sizing itself to all of them
+PAGE_WORKER_THREADS = max(1, (os.cpu_count() or PAGE_WORKERS) // PAGE_WORKERS)
+
 tokenizer = AutoTokenizer.from_pretrained(
     MODEL_NAME,
     model_max_length=MAX_TOKENS,
@@ -74,53 +66,210 @@ def parse_chunk(chunk: DocChunk) -> Document:
         }
     )
 
-def load_file(file_path: Path) -> list[Document]:
-    result = converter.convert(file_path)
-    chunk_iter = chunker.chunk(dl_doc=result.document)
-    chunks = list(chunk_iter)
+def artifact_path(digest: str, table_mode: str, ocr: str) -> Path:
+    return ARTIFACT_PATH / f"{digest}-{table_mode}-{ocr}.json.gz"
 
-    seen_ids = set()
-    final_chunks: list[Document] = []
+def save_artifact(dl_doc: DoclingDocument, path: Path):
+    tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        f.write(dl_doc.model_dump_json())
+    os.replace(tmp_path, path)
+
+def load_artifact(path: Path) -> DoclingDocument:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return DoclingDocument.model_validate_json(f.read())
+
+def split_range(start: int, end: int, window: int) -> list[tuple[int, int]]:
+    return [(s, min(s + window - 1, end)) for s in range(start, end + 1, window)]
+
+def plan_segments(file_path: Path, ocr: str) -> list[tuple[tuple[int, int], bool]]:
+    """
+    Split the PDF into (page_range, do_ocr) segments: runs of scanned vs.
+    born-digital pages when ocr is "auto", further cut into PAGE_WINDOW pages.
+    Windows are converted in parallel with PAGE_WORKERS > 1, and either way
+    each one is chunked and embedded while the next is still converting.
+    Other formats have no pages to split and are converted in one piece.
+    """
+    if not is_pdf(file_path):
+        return []
+    if ocr == "auto":
+        runs = page_runs(scanned_pages(file_path))
+    else:
+        runs = [(1, count_pages(file_path), ocr == "always")]
+
+    segments = []
+    for start, end, do_ocr in runs:
+        for page_range in split_range(start, end, PAGE_WINDOW):
+            segments.append((page_range, do_ocr))
+    return segments
+
+def convert_range(
+        file_path: str,
+        page_range: tuple[int, int],
+        table_mode: str,
+        do_ocr: bool,
+        profile: str = None
+) -> DoclingDocument:
+    converter = get_converter(table_mode, do_ocr, profile)
+    return converter.convert(file_path, page_range=page_range).document
+
+def convert_window(
+        file_path: str,
+        page_range: tuple[int, int],
+        table_mode: str,
+        do_ocr: bool,
+        profile: str = None
+) -> str:
+    # runs in a worker process; JSON is cheaper to ship back than a pickled tree
+    return convert_range(file_path, page_range, table_mode, do_ocr, profile).model_dump_json()
+
+def init_page_worker(num_threads: int):
+    # read by get_profile; an explicit DOCLING_NUM_THREADS still wins
+    os.environ.setdefault("DOCLING_NUM_THREADS", str(num_threads))
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+def get_page_pool() -> ProcessPoolExecutor:
+    # started once and kept, so the workers load their converters only once
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            # spawn, not fork: the parent may already hold CUDA state
+            _page_pool = ProcessPoolExecutor(
+                max_workers=PAGE_WORKERS,
+                mp_context=get_context("spawn"),
+                initializer=init_page_worker,
+                initargs=(PAGE_WORKER_THREADS,)
+            )
+        return _page_pool
 
-    for chunk in chunks:
+def reset_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is not None:
+            _page_pool.shutdown(wait=False, cancel_futures=True)
+        _page_pool = None
+
+def iter_segments(
+        file_path: Path,
+        table_mode: str,
+        segments: list[tuple[tuple[int, int], bool]],
+        profile: str = None
+):
+    """Yield one DoclingDocument per segment, in page order, as each finishes."""
+    if len(segments) <= 1:
+        do_ocr = segments[0][1] if segments else False
+        yield get_converter(table_mode, do_ocr, profile).convert(file_path).document
+        return
+
+    print(f"Converting {file_path} in {len(segments)} page segments")
+    if PAGE_WORKERS > 1:
+        parts = get_page_pool().map(
+            convert_window,
+            [str(file_path)] * len(segments),
+            [page_range for page_range, _ in segments],
+            [table_mode] * len(segments),
+            [do_ocr for _, do_ocr in segments],
+            [profile] * len(segments)
+        )
+        try:
+            for part in parts:
+                yield DoclingDocument.model_validate_json(part)
+        except BrokenProcessPool:
+            # a crashed worker breaks the pool for good; the next file gets a new one
+            reset_page_pool()
+            raise
+    else:
+        for page_range, do_ocr in segments:
+            yield convert_range(str(file_path), page_range, table_mode, do_ocr, profile)
+
+def merge_segments(docs: list[DoclingDocument]) -> DoclingDocument:
+    if len(docs) == 1:
+        return docs[0]
+    # each segment keeps its original page numbers, so concatenate adds no offset
+    dl_doc = DoclingDocument.concatenate(docs)
+    dl_doc.name = docs[0].name
+    dl_doc.origin = docs[0].origin
+    return dl_doc
+
+def convert_segments(
+        file_path: Path,
+        table_mode: str,
+        segments: list[tuple[tuple[int, int], bool]],
+        profile: str = None
+) -> DoclingDocument:
+    return merge_segments(list(iter_segments(file_path, table_mode, segments, profile)))
+
+def iter_converted(file_path: Path, options: dict = None, digest: str = None):
+    """
+    Yield the converted document segment by segment. The merged document is
+    kept in the artifact store keyed by the file content, so later runs only
+    re-chunk and get it back in one piece.
+    """
+    options = resolve_options(**(options or {}))
+    table_mode = options["table_mode"]
+    ocr = options["ocr"]
+
+    path = artifact_path(digest or file_sha256(file_path), table_mode, ocr)
+    if path.exists():
+        try:
+            dl_doc = load_artifact(path)
+        except Exception as e:
+            print(f"Ignoring unreadable artifact {path}: {str(e)}")
+        else:
+            if dl_doc.origin is not None:
+                dl_doc.origin.filename = Path(file_path).name
+            yield dl_doc
+            return
+
+    docs = []
+    for dl_doc in iter_segments(file_path, table_mode, plan_segments(file_path, ocr)):
+        docs.append(dl_doc)
+        yield dl_doc
+    save_artifact(merge_segments(docs), path)
+
+def chunk_document(dl_doc: DoclingDocument):
+    """Yield de-duplicated chunks one by one as HybridChunker produces them."""
+    seen_ids = set()
+    for chunk in chunker.chunk(dl_doc=dl_doc):
         doc = parse_chunk(chunk)
         cid = doc.metadata["chunk_id"]
         if cid not in seen_ids:
             seen_ids.add(cid)
-            final_chunks.append(doc)
-
-    return final_chunks
-
-def process_uploaded(upload_file, path: Path) -> list[Document]:
-    try:
-        file_path = path / upload_file.filename
-        with open(file_path, "wb") as f:
-            f.write(upload_file.file.read())
-
-        documents = load_file(file_path)
-        return documents
-    except Exception as e:
-        print(f"Error processing uploaded PDF: {str(e)}")
-        return []
+            yield doc
 
-def process_specific_upload(upload_file: UploadFile) -> list[Document]:
-    return process_uploaded(upload_file, SPECIFIC_UPLOAD_PATH)
+def extract_member(archive_path: str, member: str, path: Path, filename: str = None) -> tuple[Path, str]:
+    # pull a single PDF out of the archive right before it is processed
+    target_path = path / (filename or Path(member).name)
+    with zipfile.ZipFile(archive_path) as archive:
+        with archive.open(member) as src:
+            digest = write_stream(src, target_path)
+    return target_path, digest
 
-def process_shared_upload(upload_file: UploadFile) -> list[Document]:
-    return process_uploaded(upload_file, SHARED_UPLOAD_PATH)
+def save_to(file_path: str, path: Path, move: bool = False, filename: str = None) -> Path:
+    """
+    Place ``file_path`` into the upload folder, as ``filename`` if given,
+    without copying the bytes when possible: rename when we own the file
+    (``move``), hardlink otherwise, and only fall back to a copy across
+    filesystems.
+    """
+    source = Path(file_path)
+    filename = filename or source.name
+    target_path = path / filename
+    if target_path.exists() and target_path.samefile(source):
+        return target_path
 
-def process_saved(file_path: str, path: Path) -> list[Document]:
+    tmp_path = path / f".{filename}.{os.getpid()}.tmp"
     try:
-        target_path = path / Path(file_path).name
-        shutil.copy(file_path, target_path)
-        documents = load_file(target_path)
-        return documents
-    except Exception as e:
-        print(f"Error processing saved PDF: {str(e)}")
-        return []
-
-def process_specific_saved(file_path: str) -> list[Document]:
-    return process_saved(file_path, SPECIFIC_UPLOAD_PATH)
+        if move:
+            os.replace(source, target_path)
+            return target_path
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copy(source, tmp_path)
+        if move:
+            source.unlink()
+    os.replace(tmp_path, target_path)
+    return target_path
 
-def process_shared_saved(file_path: str) -> list[Document]:
-    return process_saved(file_path, SHARED_UPLOAD_PATH)
\ No newline at end of file
@@ -0,0 +1,80 @@
+import re
+
+# model numbers mix letters and digits and are often written with separators
+# ("FTXM-35R", "FTXM 35 R"), so they are indexed with the separators removed;
+# plain numbers ("4500") and measurements ("500 kg") would match most manuals
+MODEL_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[-/.][A-Za-z0-9]+)*")
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z&']+")
+MIN_MODEL_LENGTH = 2
+# shorter model numbers only match exactly, or "FX1" would find every FX1xx
+MIN_PREFIX_LENGTH = 4
+# how many space-separated tokens may make up one model number
+MAX_JOINED_TOKENS = 3
+
+def normalize_model(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]", "", text).upper()
+
+def normalize_word(text: str) -> str:
+    return text.lower()
+
+def is_model(token: str) -> bool:
+    return (
+        len(token) >= MIN_MODEL_LENGTH
+        and any(c.isdigit() for c in token)
+        and any(c.isalpha() for c in token)
+    )
+
+def model_candidates(line: str) -> set[str]:
+    """
+    Normalized tokens of ``line`` plus the joins of up to MAX_JOINED_TOKENS
+    tokens separated only by spaces, so "FTXM 35 R" is indexed as FTXM35R.
+    Only tokens without lowercase letters are joined, which keeps units and
+    prose ("500 kg", "Model 12") apart.
+    """
+    candidates = set()
+    matches = list(MODEL_PATTERN.finditer(line))
+    for i, match in enumerate(matches):
+        joined = normalize_model(match.group())
+        candidates.add(joined)
+        for j in range(i, min(i + MAX_JOINED_TOKENS, len(matches))):
+            if j > i and line[matches[j - 1].end():matches[j].start()].strip(" \t"):
+                break
+            if any(c.islower() for c in matches[j].group()):
+                break
+            if j > i:
+                joined += normalize_model(matches[j].group())
+                candidates.add(joined)
+    return candidates
+
+def extract_identifiers(text: str) -> dict[str, set[str]]:
+    """
+    Collect normalized model-number candidates and words from ``text``. Only
+    capitalized words are kept, as manufacturer names are written that way.
+    """
+    models = {
+        model for line in text.splitlines() for model in model_candidates(line)
+        if is_model(model)
+    }
+    words = {normalize_word(word) for word in WORD_PATTERN.findall(text) if not word.islower()}
+    return {"model": models, "word": words}
+
+def query_identifiers(manufacturer: str, model_number: str) -> dict[str, list[str]]:
+    """
+    Split the user's manufacturer and model number into the normalized values
+    a document has to contain. Manufacturer words that look like model numbers
+    ("3M") are matched against the model index.
+    """
+    identifiers = {"model": [], "word": [], "model_prefix": []}
+    for token in MODEL_PATTERN.findall(manufacturer):
+        if is_model(normalize_model(token)):
+            identifiers["model"].append(normalize_model(token))
+        else:
+            identifiers["word"].extend(normalize_word(w) for w in WORD_PATTERN.findall(token))
+    if model_number.strip():
+        # "FTXM35" should still find manuals that only list "FTXM35R"
+        model = normalize_model(model_number)
+        if is_model(model) and len(model) >= MIN_PREFIX_LENGTH:
+            identifiers["model_prefix"].append(model)
+        elif model:
+            identifiers["model"].append(model)
+    return identifiers
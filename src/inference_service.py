@@ -0,0 +1,70 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import threading
+
+# workers only prepare prompts and wait on the batch scheduler, so allow as
+# many as the scheduler can batch together
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", os.getenv("BATCH_MAX_SIZE", "8")))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "16"))
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "300"))
+
+class QueueFullError(Exception):
+    pass
+
+# A dedicated pool so generate() never runs on the event loop or competes with
+# FastAPI's default threadpool; the semaphore bounds running + waiting jobs.
+executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+_slots = threading.BoundedSemaphore(INFERENCE_WORKERS + INFERENCE_QUEUE_SIZE)
+_pending = 0
+_pending_lock = threading.Lock()
+
+def _acquire():
+    global _pending
+    if not _slots.acquire(blocking=False):
+        raise QueueFullError("Inference queue is full, please retry later.")
+    with _pending_lock:
+        _pending += 1
+
+def _release(_future: Future = None):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+    _slots.release()
+
+class Slot:
+    """A queue slot held for the lifetime of a streamed answer."""
+
+    def __init__(self):
+        _acquire()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        _release()
+
+def submit(fn, *args) -> Future:
+    _acquire()
+    future = executor.submit(fn, *args)
+    future.add_done_callback(_release)
+    return future
+
+async def run_inference(fn, *args, timeout: float = INFERENCE_TIMEOUT):
+    future = submit(fn, *args)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        # only drops jobs still waiting in the queue; a running generate() finishes
+        future.cancel()
+        raise
+
+def inference_status() -> dict:
+    return {
+        "workers": INFERENCE_WORKERS,
+        "queue_size": INFERENCE_QUEUE_SIZE,
+        "pending": _pending,
+    }
@@ -0,0 +1,252 @@
+from concurrent.futures import Future
+import json
+import os
+from pathlib import Path
+import queue
+import threading
+import time
+
+from src.attribute_index import chunk_cells
+from src.cache_service import bump_version
+from src.chroma_service import (
+    batched,
+    embed_batch,
+    existing_ids,
+    max_batch_size,
+    update_metadata,
+    upsert_batch
+)
+from src.config import CACHE_PATH
+from src.embedding_cache import embedding_cache
+from src.file_service import chunk_document, iter_converted
+from src.identifiers import extract_identifiers
+
+INGEST_CONVERT_WORKERS = int(os.getenv("INGEST_CONVERT_WORKERS", "1"))
+INGEST_CHUNK_WORKERS = int(os.getenv("INGEST_CHUNK_WORKERS", "1"))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+
+METRICS_PATH = CACHE_PATH / "ingest_metrics.json"
+
+class IngestJob:
+    def __init__(self, file_path: Path, name: str, options: dict, digest: str = None):
+        self.file_path = file_path
+        self.name = name
+        self.options = options
+        self.digest = digest
+        self.future = Future()
+        self.chunk_ids = []
+        self.new_chunks = 0
+        # the file name often carries the model number as well
+        self.identifiers = extract_identifiers(Path(file_path).stem)
+        self.attributes = []
+        self.segments_converted = 0
+        self.segments_chunked = 0
+        self.conversion_done = False
+        self.batches_emitted = 0
+        self.batches_written = 0
+        self.stage_seconds = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @property
+    def failed(self) -> bool:
+        return self.future.done() and self.future.exception() is not None
+
+    def add_time(self, stage: str, seconds: float):
+        with self._lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0) + seconds
+
+    def fail(self, error: Exception):
+        with self._lock:
+            if not self.future.done():
+                self.future.set_exception(error)
+
+    def collect(self, batch):
+        found = extract_identifiers("\n".join(chunk.page_content for chunk in batch))
+        cells = chunk_cells(batch)
+        with self._lock:
+            for kind, values in found.items():
+                self.identifiers[kind] |= values
+            self.attributes.extend(cells)
+
+    def converted(self, done: bool = False):
+        with self._lock:
+            if done:
+                self.conversion_done = True
+            else:
+                self.segments_converted += 1
+        self._maybe_finish()
+
+    def emitted(self, done: bool = False):
+        with self._lock:
+            if done:
+                self.segments_chunked += 1
+            else:
+                self.batches_emitted += 1
+        self._maybe_finish()
+
+    def written(self, ids: list[str], new_chunks: int):
+        with self._lock:
+            self.chunk_ids.extend(ids)
+            self.new_chunks += new_chunks
+            self.batches_written += 1
+        self._maybe_finish()
+
+    def _maybe_finish(self):
+        with self._lock:
+            if self.future.done() or not self.conversion_done:
+                return
+            if self.segments_chunked < self.segments_converted:
+                return
+            if self.batches_written < self.batches_emitted:
+                return
+            self.future.set_result({
+                # a chunk repeated across page segments is written twice but listed once
+                "chunk_ids": list(dict.fromkeys(self.chunk_ids)),
+                "new_chunks": self.new_chunks,
+                "identifiers": self.identifiers,
+                "attributes": self.attributes,
+                "seconds": round(time.perf_counter() - self.started, 2),
+                "stage_seconds": {k: round(v, 2) for k, v in self.stage_seconds.items()},
+            })
+
+class Stage:
+    """A pool of threads pulling (job, item) pairs from ``inbox``."""
+
+    def __init__(self, name: str, workers: int, handler, inbox: queue.Queue):
+        self.name = name
+        self.workers = max(1, workers)
+        self.handler = handler
+        self.inbox = inbox
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f"ingest-{self.name}-{i}", daemon=True).start()
+
+    def _run(self):
+        while True:
+            job, item = self.inbox.get()
+            if job.failed:
+                continue
+            started = time.perf_counter()
+            try:
+                self.handler(job, item)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                job.fail(e)
+            elapsed = time.perf_counter() - started
+            job.add_time(self.name, elapsed)
+            with self._lock:
+                self.items += 1
+                self.busy_seconds += elapsed
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "errors": self.errors,
+            "queued": self.inbox.qsize(),
+            "busy_seconds": round(self.busy_seconds, 2),
+            "items_per_sec": round(self.items / self.busy_seconds, 2) if self.busy_seconds else 0,
+        }
+
+class IngestPipeline:
+    """
+    convert -> chunk -> embed -> write, each stage on its own thread pool and
+    connected by bounded queues so a slow stage applies backpressure upstream.
+    Chroma writes go through a single writer thread.
+    """
+
+    def __init__(self):
+        self.convert_q = queue.Queue()
+        self.chunk_q = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        self.embed_q = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        self.write_q = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        self.stages = [
+            Stage("convert", INGEST_CONVERT_WORKERS, self.convert, self.convert_q),
+            Stage("chunk", INGEST_CHUNK_WORKERS, self.chunk, self.chunk_q),
+            Stage("embed", INGEST_EMBED_WORKERS, self.embed, self.embed_q),
+            Stage("write", 1, self.write, self.write_q),
+        ]
+        self._started = False
+        self._lock = threading.Lock()
+
+    def convert(self, job: IngestJob, _item):
+        # page segments go downstream as soon as they are converted, so the
+        # first pages are embedded while later ones are still in Docling
+        for dl_doc in iter_converted(job.file_path, job.options, job.digest):
+            if job.failed:
+                return
+            job.converted()
+            self.chunk_q.put((job, dl_doc))
+        job.converted(done=True)
+
+    def chunk(self, job: IngestJob, dl_doc):
+        for batch in batched(chunk_document(dl_doc), max_batch_size()):
+            if job.failed:
+                return
+            job.emitted()
+            job.collect(batch)
+            self.embed_q.put((job, batch))
+        job.emitted(done=True)
+
+    def embed(self, job: IngestJob, batch):
+        # chunks already in the collection (unchanged between revisions, or
+        # shared with another manual) only need their metadata refreshed
+        known = existing_ids(job.name, [chunk.metadata["chunk_id"] for chunk in batch])
+        new_batch = [chunk for chunk in batch if chunk.metadata["chunk_id"] not in known]
+        old_batch = [chunk for chunk in batch if chunk.metadata["chunk_id"] in known]
+        embeddings = embed_batch(new_batch) if new_batch else []
+        self.write_q.put((job, (new_batch, embeddings, old_batch)))
+
+    def write(self, job: IngestJob, item):
+        new_batch, embeddings, old_batch = item
+        ids = upsert_batch(job.name, new_batch, embeddings) if new_batch else []
+        if old_batch:
+            update_metadata(job.name, old_batch)
+            ids += [chunk.metadata["chunk_id"] for chunk in old_batch]
+        job.written(ids, len(new_batch))
+
+    def submit(self, file_path: Path, name: str, options: dict, digest: str = None) -> Future:
+        with self._lock:
+            if not self._started:
+                for stage in self.stages:
+                    stage.start()
+                self._started = True
+        job = IngestJob(file_path, name, options, digest)
+        job.future.add_done_callback(lambda _: self._on_done(job))
+        self.convert_q.put((job, None))
+        return job.future
+
+    def _on_done(self, job: IngestJob):
+        if job.chunk_ids:
+            bump_version(job.name)
+        save_metrics(self.stats())
+
+    def stats(self) -> dict:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+def save_metrics(stats: dict):
+    # the pipeline runs in the Celery worker, the API reads this snapshot; job
+    # callbacks of different threads may write it at the same time
+    tmp_path = METRICS_PATH.with_suffix(f".tmp{os.getpid()}-{threading.get_ident()}")
+    tmp_path.write_text(json.dumps({
+        "updated_at": time.time(),
+        "stages": stats,
+        "embedding_cache": embedding_cache.stats(),
+    }))
+    os.replace(tmp_path, METRICS_PATH)
+
+def load_metrics() -> dict:
+    try:
+        return json.loads(METRICS_PATH.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+ingest_pipeline = IngestPipeline()
@@ -0,0 +1,224 @@
+import os
+from pathlib import Path
+import time
+
+from src.cache_service import bump_version
+from src.chroma_service import (
+    collection_sources,
+    copy_chunks,
+    delete_chunks,
+    delete_collection,
+    get_collection,
+    source_chunks
+)
+from src.config import SPECIFIC_UPLOAD_PATH, SHARED_UPLOAD_PATH
+from src.file_service import save_to
+from src.identifiers import extract_identifiers
+from src.ingest_pipeline import ingest_pipeline
+from src.manifest_service import (
+    file_sha256,
+    find_document,
+    find_source,
+    forget_document,
+    forget_source_rows,
+    identified_sources,
+    list_documents,
+    move_source_rows,
+    record_attributes,
+    record_document,
+    record_identifiers,
+    referenced_chunk_ids
+)
+from src.pipeline_profiles import resolve_options
+from src.text_layer import count_pages
+
+UPLOAD_PATHS = {
+    "specific": SPECIFIC_UPLOAD_PATH,
+    "shared": SHARED_UPLOAD_PATH,
+}
+
+def check_collection(name: str):
+    if name not in UPLOAD_PATHS:
+        raise ValueError(f"Unknown collection: {name}")
+
+def check_source(source: str) -> str:
+    if not source or Path(source).name != source:
+        raise ValueError(f"Invalid source name: {source}")
+    return source
+
+def index_saved(
+        file_path: str,
+        name: str,
+        options: dict = None,
+        digest: str = None,
+        move: bool = False,
+        force: bool = False,
+        filename: str = None
+) -> dict:
+    options = resolve_options(**(options or {}))
+    filename = filename or Path(file_path).name
+    digest = digest or file_sha256(file_path)
+    existing = find_document(digest, name)
+    if existing and not force:
+        return {
+            "status": "done",
+            "msg": f"{filename} already indexed as {existing['source']}",
+            "already_indexed": True,
+            "chunks": len(existing["chunk_ids"]),
+            "pages": count_pages(file_path),
+        }
+
+    # a different revision of the same source file is diffed against this one
+    previous = find_source(filename, name)
+
+    target_path = save_to(file_path, UPLOAD_PATHS[name], move=move, filename=filename)
+    result = ingest_pipeline.submit(target_path, name, options, digest).result()
+    chunk_ids = result["chunk_ids"]
+    if not chunk_ids:
+        raise ValueError("No documents extracted")
+    record_document(digest, name, target_path.name, chunk_ids, options)
+    record_identifiers(name, target_path.name, result["identifiers"])
+    record_attributes(name, target_path.name, result["attributes"])
+
+    removed = 0
+    if previous:
+        removed = remove_revision(previous, name, digest, chunk_ids)
+    return {
+        "status": "done",
+        "msg": f"Indexed {file_path}",
+        "already_indexed": False,
+        "chunks": len(chunk_ids),
+        "added": result["new_chunks"],
+        "unchanged": len(chunk_ids) - result["new_chunks"],
+        "removed": removed,
+        "pages": count_pages(target_path),
+        "seconds": result["seconds"],
+        "stage_seconds": result["stage_seconds"],
+    }
+
+def remove_revision(previous: dict, name: str, digest: str, keep_ids: list[str]) -> int:
+    if previous["sha256"] != digest:
+        forget_document(previous["sha256"], name)
+    still_used = set(keep_ids) | referenced_chunk_ids(name, previous["chunk_ids"])
+    stale = [cid for cid in previous["chunk_ids"] if cid not in still_used]
+    delete_chunks(name, stale)
+    return len(stale)
+
+def rebuild_collection(name: str) -> dict:
+    # converted documents come from the artifact store, so this only re-chunks
+    # and re-embeds what is already in the upload folder; each file keeps the
+    # options it was indexed with, or the artifact would not be found
+    options = {doc["source"]: doc["options"] for doc in list_documents(name)}
+    delete_collection(name)
+    indexed, failed = [], []
+    for file_path in sorted(UPLOAD_PATHS[name].iterdir()):
+        try:
+            index_saved(str(file_path), name, options.get(file_path.name))
+            indexed.append(file_path.name)
+        except Exception as e:
+            failed.append({"file": file_path.name, "error": str(e)})
+    return {"status": "done", "indexed": indexed, "failed": failed}
+
+def backfill_identifiers(name: str) -> dict:
+    """
+    Index the identifiers of sources embedded before the identifier index
+    existed; the source filter of a query would leave them out otherwise.
+    """
+    check_collection(name)
+    missing = collection_sources(name) - identified_sources(name)
+    for source in sorted(missing):
+        # the file name often carries the model number as well
+        chunks = source_chunks(name, source, include=["documents"])
+        text = "\n".join([Path(source).stem, *chunks["documents"]])
+        record_identifiers(name, source, extract_identifiers(text))
+    if missing:
+        bump_version(name)
+    return {"status": "done", "collection": name, "sources": sorted(missing)}
+
+def forget_source(source: str, name: str):
+    while (row := find_source(source, name)) is not None:
+        forget_document(row["sha256"], name)
+
+def delete_source(source: str, name: str) -> dict:
+    check_collection(name)
+    check_source(source)
+    started = time.perf_counter()
+    document = find_source(source, name)
+    # a chunk shared with another manual carries whichever source wrote it
+    # last, so the manifest ids are needed on top of the metadata match
+    candidates = set(source_chunks(name, source)["ids"])
+    if document:
+        candidates.update(document["chunk_ids"])
+    forget_source(source, name)
+    forget_source_rows(name, source)
+    still_used = referenced_chunk_ids(name, list(candidates))
+    stale = [cid for cid in candidates if cid not in still_used]
+    delete_chunks(name, stale)
+
+    file_path = UPLOAD_PATHS[name] / source
+    if file_path.exists():
+        file_path.unlink()
+    return {
+        "source": source,
+        "collection": name,
+        "chunks": len(stale),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+def reindex_source(source: str, name: str, options: dict = None) -> dict:
+    check_collection(name)
+    check_source(source)
+    file_path = UPLOAD_PATHS[name] / source
+    if not file_path.exists():
+        raise ValueError(f"{source} is not in the {name} upload folder")
+    started = time.perf_counter()
+    # like a rebuild, keep the options the document was indexed with unless
+    # the caller overrides them
+    document = find_source(source, name)
+    options = {**((document and document["options"]) or {}), **(options or {})}
+    result = index_saved(str(file_path), name, options, force=True)
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    return result
+
+def move_source(source: str, from_name: str, to_name: str) -> dict:
+    check_collection(from_name)
+    check_collection(to_name)
+    check_source(source)
+    if from_name == to_name:
+        raise ValueError("Source and target collection are the same")
+    file_path = UPLOAD_PATHS[from_name] / source
+    if not file_path.exists():
+        raise ValueError(f"{source} is not in the {from_name} upload folder")
+    if (UPLOAD_PATHS[to_name] / source).exists():
+        raise ValueError(f"{source} already exists in the {to_name} upload folder")
+    started = time.perf_counter()
+
+    # copy the stored vectors across instead of re-embedding
+    document = find_source(source, from_name)
+    include = ["embeddings", "documents", "metadatas"]
+    if document:
+        chunks = get_collection(from_name).get(ids=document["chunk_ids"], include=include)
+    else:
+        chunks = source_chunks(from_name, source, include=include)
+    if chunks["ids"]:
+        copy_chunks(to_name, chunks)
+
+    target_path = UPLOAD_PATHS[to_name] / source
+    os.replace(file_path, target_path)
+    digest = document["sha256"] if document else file_sha256(target_path)
+    chunk_ids = document["chunk_ids"] if document else chunks["ids"]
+    record_document(digest, to_name, source, chunk_ids, document["options"] if document else None)
+    move_source_rows(source, from_name, to_name)
+
+    forget_source(source, from_name)
+    still_used = referenced_chunk_ids(from_name, chunks["ids"])
+    stale = [cid for cid in chunks["ids"] if cid not in still_used]
+    delete_chunks(from_name, stale)
+    bump_version(to_name)
+    return {
+        "source": source,
+        "from": from_name,
+        "to": to_name,
+        "chunks": len(chunks["ids"]),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
@@ -0,0 +1,116 @@
+from collections import Counter
+import math
+import os
+import re
+import sqlite3
+import threading
+
+from src.config import CHROMA_PATH
+
+LEXICAL_PATH = CHROMA_PATH / "lexical.sqlite3"
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "with",
+}
+
+_lock = threading.Lock()
+_conn = sqlite3.connect(LEXICAL_PATH, check_same_thread=False, timeout=30)
+_conn.execute(
+    "CREATE TABLE IF NOT EXISTS chunks ("
+    "collection TEXT, chunk_id TEXT, source TEXT, length INTEGER, "
+    "PRIMARY KEY (collection, chunk_id))"
+)
+_conn.execute(
+    "CREATE TABLE IF NOT EXISTS postings ("
+    "collection TEXT, term TEXT, chunk_id TEXT, tf INTEGER, "
+    "PRIMARY KEY (collection, term, chunk_id))"
+)
+_conn.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings (collection, chunk_id)")
+_conn.commit()
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased word tokens. Compound identifiers ("LF-1101", "EXDN/2") also
+    yield their parts and the joined form, so any spelling of them matches.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        parts = re.split(r"[-/.]", token)
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+        tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+def index_chunks(collection: str, ids: list[str], texts: list[str], sources: list[str]):
+    chunk_rows, posting_rows = [], []
+    for cid, text, source in zip(ids, texts, sources):
+        counts = Counter(tokenize(text))
+        chunk_rows.append((collection, cid, source, sum(counts.values())))
+        posting_rows.extend((collection, term, cid, tf) for term, tf in counts.items())
+    with _lock:
+        _conn.executemany(
+            "DELETE FROM postings WHERE collection = ? AND chunk_id = ?",
+            [(collection, cid) for cid in ids]
+        )
+        _conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)", chunk_rows)
+        _conn.executemany("INSERT OR REPLACE INTO postings VALUES (?, ?, ?, ?)", posting_rows)
+        _conn.commit()
+
+def update_sources(collection: str, ids: list[str], sources: list[str]):
+    with _lock:
+        _conn.executemany(
+            "UPDATE chunks SET source = ? WHERE collection = ? AND chunk_id = ?",
+            [(source, collection, cid) for cid, source in zip(ids, sources)]
+        )
+        _conn.commit()
+
+def remove_chunks(collection: str, ids: list[str]):
+    rows = [(collection, cid) for cid in ids]
+    with _lock:
+        _conn.executemany("DELETE FROM postings WHERE collection = ? AND chunk_id = ?", rows)
+        _conn.executemany("DELETE FROM chunks WHERE collection = ? AND chunk_id = ?", rows)
+        _conn.commit()
+
+def forget_collection(collection: str):
+    with _lock:
+        _conn.execute("DELETE FROM postings WHERE collection = ?", (collection,))
+        _conn.execute("DELETE FROM chunks WHERE collection = ?", (collection,))
+        _conn.commit()
+
+def search(collection: str, text: str, limit: int, sources: set[str] = None) -> list[str]:
+    """Chunk ids of ``collection`` ranked by BM25 against ``text``."""
+    terms = set(tokenize(text))
+    if not terms:
+        return []
+    with _lock:
+        total, avg_length = _conn.execute(
+            "SELECT COUNT(*), AVG(length) FROM chunks WHERE collection = ?", (collection,)
+        ).fetchone()
+        if not total:
+            return []
+        postings = {
+            term: _conn.execute(
+                "SELECT p.chunk_id, p.tf, c.length, c.source FROM postings p "
+                "JOIN chunks c ON c.collection = p.collection AND c.chunk_id = p.chunk_id "
+                "WHERE p.collection = ? AND p.term = ?",
+                (collection, term)
+            ).fetchall()
+            for term in terms
+        }
+
+    scores = Counter()
+    for rows in postings.values():
+        if not rows:
+            continue
+        idf = math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+        for cid, tf, length, source in rows:
+            if sources is not None and source not in sources:
+                continue
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+            scores[cid] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+    return [cid for cid, _ in scores.most_common(limit)]
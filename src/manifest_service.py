@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from src.config import CHROMA_PATH
+from src.identifiers import query_identifiers
+
+MANIFEST_PATH = CHROMA_PATH / "manifest.sqlite3"
+# stay under SQLite's bound parameter limit
+MAX_PARAMS = 500
+
+_lock = threading.Lock()
+_conn = sqlite3.connect(MANIFEST_PATH, check_same_thread=False, timeout=30)
+# options are the conversion options a document was indexed with, so a
+# rebuild converts it the same way and finds its artifact
+_conn.execute(
+    "CREATE TABLE IF NOT EXISTS documents ("
+    "sha256 TEXT, collection TEXT, source TEXT, chunk_ids TEXT, indexed_at REAL, options TEXT, "
+    "PRIMARY KEY (sha256, collection))"
+)
+# one row per chunk of each document, so checking whether a chunk is still
+# used by another document does not decode every manifest entry
+_conn.execute(
+    "CREATE TABLE IF NOT EXISTS chunk_refs ("
+    "collection TEXT, chunk_id TEXT, sha256 TEXT, "
+    "PRIMARY KEY (collection, chunk_id, sha256))"
+)
+_conn.execute("CREATE INDEX IF NOT EXISTS chunk_refs_document ON chunk_refs (sha256, collection)")
+# normalized model numbers and words found in each indexed source, so queries
+# can narrow to the right manuals with an exact metadata filter
+_conn.execute(
+    "CREATE TABLE IF NOT EXISTS identifiers ("
+    "collection TEXT, source TEXT, kind TEXT, value TEXT, "
+    "PRIMARY KEY (collection, source, kind, value))"
+)
+_conn.execute("CREATE INDEX IF NOT EXISTS identifiers_value ON identifiers (kind, value)")
+# (row label, column label, value) cells of the tables in each source
+# with each label's normalized key, which attribute lookups match exactly
+_conn.execute(
+    "CREATE TABLE IF NOT EXISTS attributes ("
+    "collection TEXT, source TEXT, row_label TEXT, col_label TEXT, value TEXT, pages TEXT, "
+    "row_key TEXT, col_key TEXT)"
+)
+_conn.execute("CREATE INDEX IF NOT EXISTS attributes_source ON attributes (source, collection)")
+_conn.execute("CREATE INDEX IF NOT EXISTS attributes_row_key ON attributes (row_key)")
+_conn.execute("CREATE INDEX IF NOT EXISTS attributes_col_key ON attributes (col_key)")
+_conn.commit()
+
+def file_sha256(file_path: Path, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_stream(fileobj, target_path: Path, block_size: int = 1024 * 1024) -> str:
+    """
+    Copy ``fileobj`` to ``target_path`` one block at a time, hashing as the
+    bytes go by, and rename into place once complete. Returns the SHA-256.
+    """
+    digest = hashlib.sha256()
+    tmp_path = target_path.with_name(f".{target_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        for block in iter(lambda: fileobj.read(block_size), b""):
+            digest.update(block)
+            f.write(block)
+    os.replace(tmp_path, target_path)
+    return digest.hexdigest()
+
+def row_to_dict(row) -> dict:
+    return {
+        "sha256": row[0],
+        "collection": row[1],
+        "source": row[2],
+        "chunk_ids": json.loads(row[3]),
+        "indexed_at": row[4],
+        "options": json.loads(row[5]) if row[5] else None,
+    }
+
+def find_document(sha256: str, collection: str) -> dict | None:
+    with _lock:
+        row = _conn.execute(
+            "SELECT * FROM documents WHERE sha256 = ? AND collection = ?",
+            (sha256, collection)
+        ).fetchone()
+    return row_to_dict(row) if row else None
+
+def record_document(sha256: str, collection: str, source: str, chunk_ids: list[str], options: dict = None):
+    with _lock:
+        _conn.execute(
+            "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+            (sha256, collection, source, json.dumps(chunk_ids), time.time(),
+             json.dumps(options) if options else None)
+        )
+        _conn.execute(
+            "DELETE FROM chunk_refs WHERE sha256 = ? AND collection = ?", (sha256, collection)
+        )
+        _conn.executemany(
+            "INSERT OR IGNORE INTO chunk_refs VALUES (?, ?, ?)",
+            [(collection, cid, sha256) for cid in chunk_ids]
+        )
+        _conn.commit()
+
+def find_source(source: str, collection: str) -> dict | None:
+    with _lock:
+        row = _conn.execute(
+            "SELECT * FROM documents WHERE source = ? AND collection = ? ORDER BY indexed_at DESC",
+            (source, collection)
+        ).fetchone()
+    return row_to_dict(row) if row else None
+
+def forget_document(sha256: str, collection: str):
+    with _lock:
+        _conn.execute(
+            "DELETE FROM documents WHERE sha256 = ? AND collection = ?", (sha256, collection)
+        )
+        _conn.execute(
+            "DELETE FROM chunk_refs WHERE sha256 = ? AND collection = ?", (sha256, collection)
+        )
+        _conn.commit()
+
+def referenced_chunk_ids(collection: str, chunk_ids: list[str]) -> set[str]:
+    """Those of ``chunk_ids`` that some document of ``collection`` still uses."""
+    # chunk ids are content hashes, so two manuals can share a chunk
+    chunk_ids = list(set(chunk_ids))
+    rows = []
+    with _lock:
+        for i in range(0, len(chunk_ids), MAX_PARAMS):
+            batch = chunk_ids[i:i + MAX_PARAMS]
+            rows += _conn.execute(
+                "SELECT DISTINCT chunk_id FROM chunk_refs WHERE collection = ? "
+                f"AND chunk_id IN ({', '.join('?' * len(batch))})",
+                (collection, *batch)
+            ).fetchall()
+    return {row[0] for row in rows}
+
+def list_documents(collection: str) -> list[dict]:
+    with _lock:
+        rows = _conn.execute(
+            "SELECT * FROM documents WHERE collection = ? ORDER BY indexed_at", (collection,)
+        ).fetchall()
+    return [row_to_dict(row) for row in rows]
+
+def forget_collection(collection: str):
+    with _lock:
+        _conn.execute("DELETE FROM documents WHERE collection = ?", (collection,))
+        _conn.execute("DELETE FROM chunk_refs WHERE collection = ?", (collection,))
+        _conn.execute("DELETE FROM identifiers WHERE collection = ?", (collection,))
+        _conn.execute("DELETE FROM attributes WHERE collection = ?", (collection,))
+        _conn.commit()
+
+def record_identifiers(collection: str, source: str, identifiers: dict[str, set[str]]):
+    rows = [
+        (collection, source, kind, value)
+        for kind, values in identifiers.items()
+        for value in values
+    ]
+    with _lock:
+        _conn.execute(
+            "DELETE FROM identifiers WHERE collection = ? AND source = ?", (collection, source)
+        )
+        _conn.executemany("INSERT OR IGNORE INTO identifiers VALUES (?, ?, ?, ?)", rows)
+        _conn.commit()
+
+def identified_sources(collection: str) -> set[str]:
+    with _lock:
+        rows = _conn.execute(
+            "SELECT DISTINCT source FROM identifiers WHERE collection = ?", (collection,)
+        ).fetchall()
+    return {row[0] for row in rows}
+
+def record_attributes(collection: str, source: str, cells: list[tuple[str, str, str, str, str, str]]):
+    with _lock:
+        _conn.execute(
+            "DELETE FROM attributes WHERE collection = ? AND source = ?", (collection, source)
+        )
+        _conn.executemany(
+            "INSERT INTO attributes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(collection, source, *cell) for cell in cells]
+        )
+        _conn.commit()
+
+def attributes_for(sources: set[str], key: str) -> list[dict]:
+    """Cells of ``sources`` whose row or column label normalizes to ``key``."""
+    sources = sorted(sources)
+    rows = []
+    with _lock:
+        for i in range(0, len(sources), MAX_PARAMS):
+            batch = sources[i:i + MAX_PARAMS]
+            rows += _conn.execute(
+                "SELECT collection, source, row_label, col_label, value, pages, row_key, col_key "
+                "FROM attributes WHERE (row_key = ? OR col_key = ?) "
+                f"AND source IN ({', '.join('?' * len(batch))})",
+                (key, key, *batch)
+            ).fetchall()
+    keys = ("collection", "source", "row_label", "col_label", "value", "pages", "row_key", "col_key")
+    return [dict(zip(keys, row)) for row in rows]
+
+# per-source rows kept next to the manifest entry of a document
+SOURCE_TABLES = ("identifiers", "attributes")
+
+def forget_source_rows(collection: str, source: str):
+    with _lock:
+        for table in SOURCE_TABLES:
+            _conn.execute(
+                f"DELETE FROM {table} WHERE collection = ? AND source = ?", (collection, source)
+            )
+        _conn.commit()
+
+def move_source_rows(source: str, from_collection: str, to_collection: str):
+    with _lock:
+        for table in SOURCE_TABLES:
+            _conn.execute(
+                f"DELETE FROM {table} WHERE collection = ? AND source = ?", (to_collection, source)
+            )
+            _conn.execute(
+                f"UPDATE {table} SET collection = ? WHERE collection = ? AND source = ?",
+                (to_collection, from_collection, source)
+            )
+        _conn.commit()
+
+def match_sources(manufacturer: str, model_number: str) -> set[str] | None:
+    """
+    Sources whose indexed identifiers contain the manufacturer and model
+    number, or None when neither was given.
+    """
+    identifiers = query_identifiers(manufacturer, model_number)
+    lookups = (
+        [sources_with("model", value) for value in identifiers["model"]] +
+        [sources_with("word", value) for value in identifiers["word"]] +
+        [sources_with("model", value, prefix=True) for value in identifiers["model_prefix"]]
+    )
+    if not lookups:
+        return None
+    return set.intersection(*lookups)
+
+def sources_with(kind: str, value: str, prefix: bool = False) -> set[str]:
+    if prefix:
+        # a range scan keeps the prefix match on the (kind, value) index
+        query = "SELECT DISTINCT source FROM identifiers WHERE kind = ? AND value >= ? AND value < ?"
+        params = (kind, value, value + "\uffff")
+    else:
+        query = "SELECT DISTINCT source FROM identifiers WHERE kind = ? AND value = ?"
+        params = (kind, value)
+    with _lock:
+        rows = _conn.execute(query, params).fetchall()
+    return {row[0] for row in rows}
@@ -1,5 +1,8 @@
 import os
+import threading
+import time
 from chromadb.utils import embedding_functions
+from sentence_transformers import CrossEncoder
 from openai_harmony import (
     Conversation,
     DeveloperContent,
@@ -8,17 +11,29 @@ from openai_harmony import (
     Role,
     SystemContent,
     load_harmony_encoding,
-    ReasoningEffort
+    ReasoningEffort,
+    StreamableParser
 )
+import queue
 import torch
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
     GptOssForCausalLM,
+    StoppingCriteria,
+    StoppingCriteriaList,
     pipeline
 )
+from transformers.generation.streamers import BaseStreamer
+
+from src.cache_service import answer_cache
+from src.inference_service import INFERENCE_TIMEOUT
+from src.prefix_cache import PrefixCache
+from src.scheduler import BatchScheduler
 
 EMBED_MODEL = "sentence-transformers/all-mpnet-base-v2"
+# the model chunks are actually embedded with
+EMBEDDER_MODEL = "all-MiniLM-L6-v2"
 
 env = os.getenv("APP_ENV")
 if env == "prod":
@@ -29,45 +44,117 @@ else:
     print("Running in development mode.")
     LLM_MODEL = "Qwen/Qwen3-0.6B"
 
-enc = load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "background")
+PREFIX_CACHE_MAX_MB = int(os.getenv("PREFIX_CACHE_MAX_MB", "512"))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "20"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
 
-embedder = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+prefix_cache = PrefixCache(max_bytes=PREFIX_CACHE_MAX_MB * 1024 * 1024)
 
-tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL)
-autoModel = GptOssForCausalLM if "gpt-oss" in LLM_MODEL else AutoModelForCausalLM
-model = autoModel.from_pretrained(
-    LLM_MODEL,
-    device_map="auto",
-    dtype="auto",
-    trust_remote_code=True
-)
+_loaders = {}
+_components = {}
+_locks = {}
 
-qa_pipeline = pipeline(
-    "text-generation",
-    model=model,
-    tokenizer=tokenizer,
-    return_full_text=False
-)
+def register(name: str):
+    def decorator(loader):
+        _loaders[name] = loader
+        _locks[name] = threading.Lock()
+        return loader
+    return decorator
+
+def get_component(name: str):
+    if name in _components:
+        return _components[name]
+    with _locks[name]:
+        if name not in _components:
+            started = time.perf_counter()
+            _components[name] = _loaders[name]()
+            print(f"Loaded {name} in {time.perf_counter() - started:.1f}s")
+    return _components[name]
+
+def is_loaded(name: str) -> bool:
+    return name in _components
+
+def model_status() -> dict:
+    return {name: is_loaded(name) for name in _loaders}
+
+def warm_up(names: list[str], background: bool = False):
+    def run():
+        for name in names:
+            try:
+                get_component(name)
+            except Exception as e:
+                print(f"Warm-up of {name} failed: {e}")
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+@register("encoding")
+def load_encoding():
+    return load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
+
+@register("embedder")
+def load_embedder():
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDER_MODEL)
+
+@register("reranker")
+def load_reranker():
+    # small enough to stay off the GPU the LLM needs
+    return CrossEncoder(RERANK_MODEL, device="cpu")
+
+@register("tokenizer")
+def load_tokenizer():
+    return AutoTokenizer.from_pretrained(LLM_MODEL)
+
+@register("model")
+def load_model():
+    autoModel = GptOssForCausalLM if "gpt-oss" in LLM_MODEL else AutoModelForCausalLM
+    return autoModel.from_pretrained(
+        LLM_MODEL,
+        device_map="auto",
+        dtype="auto",
+        trust_remote_code=True
+    )
+
+@register("qa_pipeline")
+def load_qa_pipeline():
+    return pipeline(
+        "text-generation",
+        model=get_model(),
+        tokenizer=get_tokenizer(),
+        return_full_text=False
+    )
+
+def get_encoding():
+    return get_component("encoding")
+
+def get_reranker():
+    return get_component("reranker")
 
 def get_tokenizer():
-    return tokenizer
+    return get_component("tokenizer")
+
+def get_model():
+    return get_component("model")
 
 def get_embedder():
-    return embedder
+    return get_component("embedder")
 
 def model_predict_from_prompt(prompt: str):
-    generated_ids = qa_pipeline(prompt, max_new_tokens=1024, do_sample=False)
+    generated_ids = get_component("qa_pipeline")(prompt, max_new_tokens=1024, do_sample=False)
     raw_output = generated_ids[0]["generated_text"].strip()
     answer = raw_output.split("<END>")[0].strip()
     return answer
 
-def prepare_convo(
-        manufacturer: str,
-        model_number: str,
-        query_attr: str,
-        hits: str
-) -> Conversation:
-    system_message = (
+BATCH_ATTRS_PER_PROMPT = int(os.getenv("BATCH_ATTRS_PER_PROMPT", "10"))
+
+def build_system_content() -> SystemContent:
+    return (
     SystemContent.new()
         .with_model_identity("You are a retrieval-augmented assistant.")
         .with_reasoning_effort(ReasoningEffort.LOW)
@@ -76,64 +163,350 @@ def prepare_convo(
         .with_required_channels(["final"])
     )
 
-    task_ins = (
+# Everything per-request (attribute, manufacturer, model number) lives in the
+# user message so the system + developer messages form a static prefix whose
+# KV cache can be reused across requests.
+SINGLE_INSTRUCTIONS = "\n---------------------\n".join([
+    (
         "Task:\n"
-        f"- Read the document content and extract the value of the attribute {query_attr}.\n"
+        "- Read the document content and extract the value of the requested attribute.\n"
         "- If multiple possible answers exist, return all unique values found, up to 5 in total.\n"
         "- Always prioritize answers from the 'SPECIFIC COLLECTION'.\n"
-    )
-
-    constraints_ins = "Constraints:\n"
-    if manufacturer and model_number:
-        constraints_ins += f"- Ensure the answer matches manufacturer {manufacturer} and model number {model_number}.\n"
-    elif manufacturer:
-        constraints_ins += f"- Ensure the answer matches manufacturer {manufacturer}.\n"
-    elif model_number:
-        constraints_ins += f"- Ensure the answer matches model number {model_number}.\n"
-    constraints_ins += (
+    ),
+    (
+        "Constraints:\n"
+        "- Ensure the answer matches the manufacturer and model number given in the request, if any.\n"
         "- Do not return duplicate answers.\n"
         "- Sort answers by confidence level from highest to lowest.\n"
-    )
-
-    output_ins = (
+    ),
+    (
         "Output Format:\n"
         "- Each answer must be formatted strictly as:\n"
         "value (<confidence>%) [Ref: <filename> page <page> line <line>]\n"
         "- Answers found in 'SPECIFIC COLLECTION' is roughly 15% more reliable than 'SHARED COLLECTION'.\n"
         "- Confidence maximum is 100%.\n"
         "- If no valid answers are found, answer: Not Found"
-    )
+    ),
+])
 
-    instructions = "\n---------------------\n".join([task_ins, constraints_ins, output_ins])
-    developer_message = DeveloperContent.new().with_instructions(instructions)
+BATCH_INSTRUCTIONS = "\n---------------------\n".join([
+    (
+        "Task:\n"
+        "- Read the document content and extract the value of every requested attribute.\n"
+        "- For each attribute, return all unique values found, up to 3 in total.\n"
+        "- Always prioritize answers from the 'SPECIFIC COLLECTION'.\n"
+    ),
+    (
+        "Constraints:\n"
+        "- Ensure the answers match the manufacturer and model number given in the request, if any.\n"
+        "- Do not return duplicate answers.\n"
+        "- Sort answers by confidence level from highest to lowest.\n"
+    ),
+    (
+        "Output Format:\n"
+        "- Answer every attribute on its own line, in the order given, formatted strictly as:\n"
+        "<attribute>: value (<confidence>%) [Ref: <filename> page <page> line <line>]\n"
+        "- Separate multiple values of the same attribute with ' | '.\n"
+        "- Answers found in 'SPECIFIC COLLECTION' is roughly 15% more reliable than 'SHARED COLLECTION'.\n"
+        "- Confidence maximum is 100%.\n"
+        "- If no valid answers are found for an attribute, answer: <attribute>: Not Found"
+    ),
+])
 
-    convo = Conversation.from_messages([
-        Message.from_role_and_content(Role.SYSTEM, system_message),
+def build_request(manufacturer: str, model_number: str, attr_line: str, hits: str) -> str:
+    lines = [attr_line]
+    if manufacturer:
+        lines.append(f"Manufacturer: {manufacturer}")
+    if model_number:
+        lines.append(f"Model Number: {model_number}")
+    return "\n".join(lines) + "\n\nDocument content:\n" + hits
+
+def build_convo(instructions: str, request: str) -> Conversation:
+    developer_message = DeveloperContent.new().with_instructions(instructions)
+    return Conversation.from_messages([
+        Message.from_role_and_content(Role.SYSTEM, build_system_content()),
         Message.from_role_and_content(Role.DEVELOPER, developer_message),
-        Message.from_role_and_content(Role.USER, hits)
+        Message.from_role_and_content(Role.USER, request)
     ])
-    return convo
 
-def model_predict(manufacturer: str, model_number: str, query_attr: str, hits: str) -> str:
-    try:
-        convo = prepare_convo(manufacturer, model_number, query_attr, hits)
-        prefill_ids = enc.render_conversation_for_completion(convo, Role.ASSISTANT)
-        stop_token_ids = enc.stop_tokens_for_assistant_actions()
+def prepare_convo(
+        manufacturer: str,
+        model_number: str,
+        query_attr: str,
+        hits: str
+) -> Conversation:
+    request = build_request(manufacturer, model_number, f"Attribute: {query_attr}", hits)
+    return build_convo(SINGLE_INSTRUCTIONS, request)
+
+def prepare_batch_convo(
+        manufacturer: str,
+        model_number: str,
+        query_attrs: list[str],
+        hits: str
+) -> Conversation:
+    attr_list = "\n".join(f"- {attr}" for attr in query_attrs)
+    request = build_request(manufacturer, model_number, f"Attributes:\n{attr_list}", hits)
+    return build_convo(BATCH_INSTRUCTIONS, request)
+
+def render_prefix(convo: Conversation) -> list[int]:
+    # system + developer messages, i.e. everything before the user request
+    prefix = Conversation.from_messages(convo.messages[:2])
+    return get_encoding().render_conversation(prefix)
+
+def trim_completion(completion_ids: list[int], stop_token_ids: list[int]) -> list[int]:
+    # keep everything up to and including the first stop token; the rest is padding
+    for i, token_id in enumerate(completion_ids):
+        if token_id in stop_token_ids:
+            return completion_ids[:i + 1]
+    return completion_ids
+
+class TokenStreamer(BaseStreamer):
+    """
+    Hands generated token ids to a consumer thread; cancel() stops generation.
+    Iterating raises TimeoutError once ``timeout`` seconds have passed.
+    """
+
+    def __init__(self, timeout: float = None):
+        self.queue = queue.Queue()
+        self.cancelled = False
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._prompt_seen = False
+
+    def put(self, value):
+        # generate() first passes the prompt, then one token per step
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        for token_id in value.flatten().tolist():
+            self.queue.put(token_id)
 
-        device = next(model.parameters()).device
-        input_ids = torch.tensor([prefill_ids], device=device)
+    def end(self):
+        self.queue.put(None)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __iter__(self):
+        while True:
+            remaining = None if self.deadline is None else max(0, self.deadline - time.monotonic())
+            try:
+                token_id = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError("Inference timed out.") from None
+            if token_id is None:
+                return
+            yield token_id
+
+class CancelledCriteria(StoppingCriteria):
+    def __init__(self, streamer: TokenStreamer):
+        self.streamer = streamer
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.streamer.cancelled, dtype=torch.bool, device=input_ids.device)
+
+def generate_single(request) -> list[int]:
+    model = get_model()
+    stop_token_ids = get_encoding().stop_tokens_for_assistant_actions()
+    prefill_ids = request.prefill_ids
+
+    device = next(model.parameters()).device
+    input_ids = torch.tensor([prefill_ids], device=device)
+    stream_kwargs = {}
+    if request.streamer is not None:
+        stream_kwargs = {
+            "streamer": request.streamer,
+            "stopping_criteria": StoppingCriteriaList([CancelledCriteria(request.streamer)])
+        }
+    try:
+        past_key_values = prefix_cache.lookup(model, prefill_ids, request.prefix_ids)
         outputs = model.generate(
             input_ids=input_ids,
-            max_new_tokens=256,
+            past_key_values=past_key_values,
+            max_new_tokens=request.max_new_tokens,
             do_sample=False,
-            eos_token_id=stop_token_ids
+            eos_token_id=stop_token_ids,
+            **stream_kwargs
         )
-        completion_ids = outputs[0][len(prefill_ids):].cpu().tolist()
-        parsed = enc.parse_messages_from_completion_tokens(completion_ids, Role.ASSISTANT)
+    finally:
+        if request.streamer is not None:
+            request.streamer.end()
+    return outputs[0][len(prefill_ids):].cpu().tolist()
+
+def generate_batch(requests: list) -> list[list[int]]:
+    # streamed requests emit tokens as they decode, so they run on their own
+    results = {id(r): generate_single(r) for r in requests if r.streamer is not None}
+    requests_to_batch = [r for r in requests if r.streamer is None]
+    if len(requests_to_batch) == 1:
+        results[id(requests_to_batch[0])] = generate_single(requests_to_batch[0])
+    elif requests_to_batch:
+        for r, completion in zip(requests_to_batch, generate_padded(requests_to_batch)):
+            results[id(r)] = completion
+    return [results[id(r)] for r in requests]
+
+def shared_prefix_cache(model, requests: list):
+    """
+    The cached prefix KV repeated across the batch when every request starts
+    with the same prefix (the static system/developer messages), else None.
+    """
+    prefix_ids = requests[0].prefix_ids
+    if not all(r.prefix_ids == prefix_ids and prefix_cache.applies(r.prefill_ids, prefix_ids) for r in requests):
+        return None
+    past_key_values = prefix_cache.lookup(model, requests[0].prefill_ids, prefix_ids)
+    if past_key_values is not None:
+        past_key_values.batch_repeat_interleave(len(requests))
+    return past_key_values
+
+def generate_padded(requests: list) -> list[list[int]]:
+    model = get_model()
+    tokenizer = get_tokenizer()
+    stop_token_ids = get_encoding().stop_tokens_for_assistant_actions()
+    pad_token_id = tokenizer.pad_token_id
+    if pad_token_id is None:
+        pad_token_id = stop_token_ids[0]
+
+    past_key_values = shared_prefix_cache(model, requests)
+    if past_key_values is not None:
+        # pad between the shared prefix and each request, so the cached prefix
+        # sits at the same positions in every row; position ids follow the mask
+        n = len(requests[0].prefix_ids)
+        suffixes = [r.prefill_ids[n:] for r in requests]
+        pad = max(len(suffix) for suffix in suffixes)
+        input_ids = [r.prefix_ids + [pad_token_id] * (pad - len(s)) + s for r, s in zip(requests, suffixes)]
+        attention_mask = [[1] * n + [0] * (pad - len(s)) + [1] * len(s) for s in suffixes]
+    else:
+        # left-pad so every sequence ends right where generation starts
+        max_len = max(len(r.prefill_ids) for r in requests)
+        input_ids = [[pad_token_id] * (max_len - len(r.prefill_ids)) + r.prefill_ids for r in requests]
+        attention_mask = [[0] * (max_len - len(r.prefill_ids)) + [1] * len(r.prefill_ids) for r in requests]
+    max_len = len(input_ids[0])
+
+    device = next(model.parameters()).device
+    outputs = model.generate(
+        input_ids=torch.tensor(input_ids, device=device),
+        attention_mask=torch.tensor(attention_mask, device=device),
+        past_key_values=past_key_values,
+        max_new_tokens=max(r.max_new_tokens for r in requests),
+        do_sample=False,
+        eos_token_id=stop_token_ids,
+        pad_token_id=pad_token_id
+    )
+    completions = outputs[:, max_len:].cpu().tolist()
+    return [
+        trim_completion(completion, stop_token_ids)[:r.max_new_tokens]
+        for r, completion in zip(requests, completions)
+    ]
+
+scheduler = BatchScheduler(generate_batch, window_ms=BATCH_WINDOW_MS, max_batch=BATCH_MAX_SIZE)
+
+NO_FINAL_MESSAGE = "No final message found"
+
+def generate_final(convo: Conversation, max_new_tokens: int = 256) -> str:
+    enc = get_encoding()
+    prefill_ids = enc.render_conversation_for_completion(convo, Role.ASSISTANT)
+    completion_ids = scheduler.submit(prefill_ids, render_prefix(convo), max_new_tokens)
+    parsed = enc.parse_messages_from_completion_tokens(completion_ids, Role.ASSISTANT)
+
+    final_msg = [msg for msg in parsed if msg.channel == "final"]
+    if final_msg:
+        return final_msg[-1].content[0].text
+    return NO_FINAL_MESSAGE
+
+def model_predict_stream(
+        manufacturer: str,
+        model_number: str,
+        query_attr: str,
+        hits: str,
+        timeout: float = INFERENCE_TIMEOUT
+):
+    """Yield the final-channel text of the answer as it decodes, within ``timeout`` seconds."""
+    cache_key = answer_cache.make_key(
+        LLM_MODEL, "single", SINGLE_INSTRUCTIONS, manufacturer, model_number, query_attr, hits
+    )
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    enc = get_encoding()
+    convo = prepare_convo(manufacturer, model_number, query_attr, hits)
+    prefill_ids = enc.render_conversation_for_completion(convo, Role.ASSISTANT)
+    streamer = TokenStreamer(timeout)
+    future = scheduler.submit_async(prefill_ids, render_prefix(convo), 256, streamer=streamer)
+
+    parser = StreamableParser(enc, role=Role.ASSISTANT)
+    answer = ""
+    try:
+        for token_id in streamer:
+            parser.process(token_id)
+            if parser.current_channel == "final" and parser.last_content_delta:
+                answer += parser.last_content_delta
+                yield parser.last_content_delta
+    finally:
+        # the client went away: stop decoding so the GPU moves on
+        streamer.cancel()
+    future.result()
+    if answer:
+        answer_cache.set(cache_key, answer)
 
-        final_msg = [msg for msg in parsed if msg.channel == "final"]
-        if final_msg:
-            return final_msg[-1].content[0].text
-        return "No final message found"
+def model_predict(manufacturer: str, model_number: str, query_attr: str, hits: str) -> str:
+    cache_key = answer_cache.make_key(
+        LLM_MODEL, "single", SINGLE_INSTRUCTIONS, manufacturer, model_number, query_attr, hits
+    )
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    try:
+        convo = prepare_convo(manufacturer, model_number, query_attr, hits)
+        answer = generate_final(convo)
+        if answer != NO_FINAL_MESSAGE:
+            answer_cache.set(cache_key, answer)
+        return answer
     except Exception as e:
         return f"Something went wrong :( Error: {e}"
+
+def parse_batch_answer(text: str, query_attrs: list[str]) -> dict[str, str]:
+    """Answers of the attributes that have a line in ``text``; missing ones are left out."""
+    answers = {}
+    lookup = {attr.strip().lower(): attr for attr in query_attrs}
+    for line in text.splitlines():
+        label, sep, value = line.strip().lstrip("-*").partition(":")
+        attr = lookup.get(label.strip().strip("*").strip().lower())
+        if sep and attr:
+            answers[attr] = value.strip() or "Not Found"
+    return answers
+
+def model_predict_batch(
+        manufacturer: str,
+        model_number: str,
+        query_attrs: list[str],
+        hits: str
+) -> dict[str, str]:
+    answers = {}
+    # the batch prompt answers differently from the single one, so the two
+    # never share cache entries
+    cache_keys = {
+        attr: answer_cache.make_key(
+            LLM_MODEL, "batch", BATCH_INSTRUCTIONS, manufacturer, model_number, attr, hits
+        )
+        for attr in query_attrs
+    }
+    for attr, cache_key in cache_keys.items():
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            answers[attr] = cached
+    missing = [attr for attr in query_attrs if attr not in answers]
+
+    for start in range(0, len(missing), BATCH_ATTRS_PER_PROMPT):
+        group = missing[start:start + BATCH_ATTRS_PER_PROMPT]
+        try:
+            convo = prepare_batch_convo(manufacturer, model_number, group, hits)
+            text = generate_final(convo, max_new_tokens=64 * len(group))
+            group_answers = parse_batch_answer(text, group)
+            # only cache what the model actually answered, not the default
+            # filled in for a line that is missing or cut off
+            for attr, answer in group_answers.items():
+                answer_cache.set(cache_keys[attr], answer)
+            answers.update({attr: group_answers.get(attr, "Not Found") for attr in group})
+        except Exception as e:
+            answers.update({attr: f"Something went wrong :( Error: {e}" for attr in group})
+    return {attr: answers[attr] for attr in query_attrs}
@@ -12,6 +12,8 @@ from unstructured.partition.pdf import partition_pdf
 from unstructured.chunking.title import chunk_by_title
 
 from src.config import OUTPUT_PATH, SPECIFIC_UPLOAD_PATH, SHARED_UPLOAD_PATH
+from src.manifest_service import write_stream
+from src.text_layer import scanned_pages
 
 # Extract the contents of an orig_elements field.
 def extract_orig_elements(orig_elements):
@@ -148,12 +150,20 @@ def parse_chunk(chunk) -> Document:
         }
     )
 
+def choose_ocr_mode(file_path: Path) -> str:
+    # mostly born-digital: OCR only the blocks pdfminer found no text for
+    scanned = scanned_pages(file_path)
+    if scanned and sum(scanned) * 2 < len(scanned):
+        return "individual_blocks"
+    return "entire_page"
+
 def load_pdf(file_path: Path) -> list[Document]:
     elements = partition_pdf(
         filename=file_path,
         strategy="hi_res",                            # mandatory to infer tables
         infer_table_structure=True,                   # extract tables
         languages=["eng"],
+        ocr_mode=choose_ocr_mode(file_path),          # skip full-page OCR on text PDFs
 
         extract_images_in_pdf=True,                   # mandatory to set as ``True``
         extract_image_block_types=["Image"],          # Add 'Table' to list to extract image of tables
@@ -181,8 +191,7 @@ def load_pdf(file_path: Path) -> list[Document]:
 def process_uploaded(upload_file: UploadFile, path: Path) -> list[Document]:
     try:
         file_path = path / upload_file.filename
-        with open(file_path, "wb") as f:
-            f.write(upload_file.file.read())
+        write_stream(upload_file.file, file_path)
 
         documents = load_pdf(file_path)
         return documents
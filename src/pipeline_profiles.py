@@ -0,0 +1,105 @@
+import os
+import threading
+from docling.datamodel.accelerator_options import AcceleratorDevice, AcceleratorOptions
+from docling.datamodel.base_models import InputFormat
+from docling.document_converter import DocumentConverter, PdfFormatOption
+from docling.datamodel.pipeline_options import (
+    ThreadedPdfPipelineOptions,
+    RapidOcrOptions,
+    TableFormerMode
+)
+import torch
+
+DOCLING_DEVICE = os.getenv("DOCLING_DEVICE", "auto")      # auto | cuda | mps | cpu
+DOCLING_TABLE_MODE = os.getenv("DOCLING_TABLE_MODE", "accurate")  # accurate | fast
+DOCLING_OCR = os.getenv("DOCLING_OCR", "auto")            # auto | always | never
+
+PIPELINE_PROFILES = {
+    "cuda": {
+        "device": AcceleratorDevice.CUDA,
+        "num_threads": 4,
+        "ocr_batch_size": 4,
+        "layout_batch_size": 64,
+        "table_batch_size": 4,
+    },
+    "mps": {
+        "device": AcceleratorDevice.MPS,
+        "num_threads": 4,
+        "ocr_batch_size": 4,
+        "layout_batch_size": 16,
+        "table_batch_size": 4,
+    },
+    "cpu": {
+        "device": AcceleratorDevice.CPU,
+        "num_threads": os.cpu_count() or 4,
+        "ocr_batch_size": 2,
+        "layout_batch_size": 4,
+        "table_batch_size": 2,
+    },
+}
+
+TABLE_MODES = {
+    "accurate": TableFormerMode.ACCURATE,
+    "fast": TableFormerMode.FAST,
+}
+
+def detect_device() -> str:
+    if DOCLING_DEVICE != "auto":
+        return DOCLING_DEVICE
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+def get_profile(name: str = None) -> dict:
+    profile = dict(PIPELINE_PROFILES[name or detect_device()])
+    # e.g. DOCLING_LAYOUT_BATCH_SIZE=32 overrides the tuned default
+    for key in ("num_threads", "ocr_batch_size", "layout_batch_size", "table_batch_size"):
+        value = os.getenv(f"DOCLING_{key.upper()}")
+        if value:
+            profile[key] = int(value)
+    return profile
+
+def resolve_options(table_mode: str = None, ocr: str = None) -> dict:
+    table_mode = (table_mode or DOCLING_TABLE_MODE).lower()
+    ocr = (ocr or DOCLING_OCR).lower()
+    if table_mode not in TABLE_MODES:
+        raise ValueError(f"Unknown table mode: {table_mode}")
+    if ocr not in ("auto", "always", "never"):
+        raise ValueError(f"Unknown OCR mode: {ocr}")
+    return {"table_mode": table_mode, "ocr": ocr}
+
+def build_pipeline_options(profile: dict, table_mode: str, do_ocr: bool) -> ThreadedPdfPipelineOptions:
+    pipeline_options = ThreadedPdfPipelineOptions(
+        accelerator_options=AcceleratorOptions(
+            device=profile["device"],
+            num_threads=profile["num_threads"]
+        ),
+        ocr_batch_size=profile["ocr_batch_size"],
+        layout_batch_size=profile["layout_batch_size"],
+        table_batch_size=profile["table_batch_size"],
+        do_table_structure=True,
+        do_ocr=do_ocr
+    )
+    pipeline_options.table_structure_options.do_cell_matching = False
+    pipeline_options.table_structure_options.mode = TABLE_MODES[table_mode]
+    pipeline_options.ocr_options = RapidOcrOptions(backend="torch")
+    return pipeline_options
+
+_converters = {}
+_converters_lock = threading.Lock()
+
+def get_converter(table_mode: str, do_ocr: bool, profile_name: str = None) -> DocumentConverter:
+    # converters keep their models loaded, so build one per combination and reuse it
+    profile_name = profile_name or detect_device()
+    key = (profile_name, table_mode, do_ocr)
+    with _converters_lock:
+        if key not in _converters:
+            pipeline_options = build_pipeline_options(get_profile(profile_name), table_mode, do_ocr)
+            _converters[key] = DocumentConverter(
+                format_options={
+                    InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
+                }
+            )
+        return _converters[key]
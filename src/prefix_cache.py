@@ -0,0 +1,86 @@
+from collections import OrderedDict
+import copy
+import hashlib
+import threading
+import torch
+
+def hash_ids(token_ids: list[int]) -> str:
+    return hashlib.sha256(",".join(map(str, token_ids)).encode("utf-8")).hexdigest()
+
+def cache_nbytes(past_key_values) -> int:
+    total = 0
+    for layer in getattr(past_key_values, "layers", []):
+        for tensor in (getattr(layer, "keys", None), getattr(layer, "values", None)):
+            if isinstance(tensor, torch.Tensor):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+class PrefixCache:
+    """LRU of prefilled ``past_key_values`` keyed by the hash of the prefix tokens."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": sum(self._sizes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+
+    def _prefill(self, model, prefix_ids: list[int]):
+        device = next(model.parameters()).device
+        with torch.no_grad():
+            outputs = model(
+                input_ids=torch.tensor([prefix_ids], device=device),
+                use_cache=True
+            )
+        return outputs.past_key_values
+
+    def _store(self, key: str, past_key_values):
+        size = cache_nbytes(past_key_values)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = past_key_values
+        self._sizes[key] = size
+        while sum(self._sizes.values()) > self.max_bytes:
+            old_key, _ = self._entries.popitem(last=False)
+            self._sizes.pop(old_key)
+
+    def applies(self, prefill_ids: list[int], prefix_ids: list[int]) -> bool:
+        if self.max_bytes <= 0 or not prefix_ids:
+            return False
+        # at least one token must be left for generate() to process
+        return len(prefix_ids) < len(prefill_ids) and prefill_ids[:len(prefix_ids)] == prefix_ids
+
+    def lookup(self, model, prefill_ids: list[int], prefix_ids: list[int]):
+        """
+        Return a private copy of the cached KV for ``prefix_ids`` (prefilling it on
+        a miss), or None when the cache is disabled or the prefix does not apply.
+        generate() extends the cache in place, hence the deepcopy.
+        """
+        if not self.applies(prefill_ids, prefix_ids):
+            return None
+
+        key = hash_ids(prefix_ids)
+        with self._lock:
+            past_key_values = self._entries.get(key)
+            if past_key_values is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(past_key_values)
+            self.misses += 1
+            past_key_values = self._prefill(model, prefix_ids)
+            self._store(key, past_key_values)
+            return copy.deepcopy(past_key_values)
@@ -0,0 +1,80 @@
+import os
+import threading
+
+from src.cache_service import MemoryBackend
+from src.model_service import get_reranker
+
+RERANK = os.getenv("RERANK", "0") == "1"
+# candidates fetched per query before reranking, and how many survive it
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "3"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+# chunk ids are content hashes, so a (query, chunk) score never goes stale
+RERANK_CACHE_TTL = 30 * 24 * 3600
+
+score_cache = MemoryBackend(RERANK_CACHE_SIZE)
+_stats = {"pairs": 0, "cached": 0}
+_stats_lock = threading.Lock()
+
+def score_key(query_text: str, chunk_id: str) -> str:
+    return f"{chunk_id}:{query_text}"
+
+def score_pairs(query_texts: list[str], hits: list[dict]) -> dict[tuple[str, str], float]:
+    scores, missing = {}, []
+    for query_text in query_texts:
+        for hit in hits:
+            score = score_cache.get(score_key(query_text, hit["id"]))
+            if score is None:
+                missing.append((query_text, hit))
+            else:
+                scores[(query_text, hit["id"])] = score
+
+    if missing:
+        # every uncached pair of both collections goes through the model at once
+        predicted = get_reranker().predict(
+            [(query_text, hit["document"]) for query_text, hit in missing],
+            batch_size=RERANK_BATCH_SIZE
+        )
+        for (query_text, hit), score in zip(missing, predicted):
+            scores[(query_text, hit["id"])] = float(score)
+            score_cache.set(score_key(query_text, hit["id"]), float(score), RERANK_CACHE_TTL)
+
+    with _stats_lock:
+        _stats["pairs"] += len(query_texts) * len(hits)
+        _stats["cached"] += len(query_texts) * len(hits) - len(missing)
+    return scores
+
+def rerank(query_texts: list[str], hit_lists: list[list[dict]], keep: int = RERANK_TOP_K) -> list[list[dict]]:
+    """
+    Rerank each list of ``hit_lists`` with the cross-encoder. Every query
+    keeps its ``keep`` best hits; the union is returned best score first.
+    """
+    unique = {hit["id"]: hit for hits in hit_lists for hit in hits}
+    if not unique:
+        return hit_lists
+    scores = score_pairs(query_texts, list(unique.values()))
+
+    reranked = []
+    for hits in hit_lists:
+        best = {}
+        for query_text in query_texts:
+            ranked = sorted(hits, key=lambda hit: scores[(query_text, hit["id"])], reverse=True)
+            for hit in ranked[:keep]:
+                score = scores[(query_text, hit["id"])]
+                best[hit["id"]] = max(score, best.get(hit["id"], score))
+        reranked.append(sorted(
+            (hit for hit in hits if hit["id"] in best),
+            key=lambda hit: best[hit["id"]],
+            reverse=True
+        ))
+    return reranked
+
+def rerank_stats() -> dict:
+    with _stats_lock:
+        return {
+            "enabled": RERANK,
+            "pairs": _stats["pairs"],
+            "cached": _stats["cached"],
+            "hit_rate": round(_stats["cached"] / _stats["pairs"], 3) if _stats["pairs"] else 0,
+        }
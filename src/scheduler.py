@@ -0,0 +1,87 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+class GenerationRequest:
+    def __init__(self, prefill_ids: list[int], prefix_ids: list[int], max_new_tokens: int, streamer=None):
+        self.prefill_ids = prefill_ids
+        self.prefix_ids = prefix_ids
+        self.max_new_tokens = max_new_tokens
+        self.streamer = streamer
+        self.future = Future()
+
+class BatchScheduler:
+    """
+    Collects concurrent generation requests for up to ``window_ms`` (or until
+    ``max_batch`` are waiting) and hands them to ``generate_batch`` in one call.
+    All generation runs on the scheduler thread, so the model is never entered
+    concurrently.
+    """
+
+    def __init__(self, generate_batch, window_ms: float = 20, max_batch: int = 8):
+        self.generate_batch = generate_batch
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+                self._thread.start()
+
+    def submit_async(
+            self,
+            prefill_ids: list[int],
+            prefix_ids: list[int],
+            max_new_tokens: int,
+            streamer=None
+    ) -> Future:
+        self._ensure_started()
+        request = GenerationRequest(prefill_ids, prefix_ids, max_new_tokens, streamer)
+        self._queue.put(request)
+        return request.future
+
+    def submit(self, prefill_ids: list[int], prefix_ids: list[int], max_new_tokens: int) -> list[int]:
+        return self.submit_async(prefill_ids, prefix_ids, max_new_tokens).result()
+
+    def _collect(self) -> list[GenerationRequest]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.generate_batch(batch)
+                for request, result in zip(batch, results):
+                    request.future.set_result(result)
+            except Exception as e:
+                for request in batch:
+                    if request.streamer is not None:
+                        request.streamer.end()
+                    request.future.set_exception(e)
+            self.batches += 1
+            self.requests += len(batch)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "queued": self._queue.qsize(),
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0,
+        }
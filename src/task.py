@@ -1,32 +1,105 @@
+from pathlib import Path
+import shutil
+import uuid
 from celery import Celery
+from celery.signals import worker_ready
 
-from src.chroma_service import add_to_specific, add_to_shared
-from src.file_service import process_specific_saved, process_shared_saved
+from src.config import REDIS_URL, STAGING_PATH
+from src.file_service import extract_member
+from src.ingest_service import (
+    UPLOAD_PATHS,
+    backfill_identifiers,
+    index_saved,
+    rebuild_collection,
+    reindex_source
+)
 
 celery_app = Celery(
     "tasks",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0"
+    broker=REDIS_URL,
+    backend=REDIS_URL
 )
 
+def cleanup_staging(file_path: str):
+    # uploads are staged as STAGING_PATH/<job_id>/<filename>
+    staging_dir = Path(file_path).parent
+    if staging_dir.parent.resolve() == STAGING_PATH.resolve():
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+@celery_app.task(bind=True)
+def process_specific_task(self, file_path: str, options: dict = None, digest: str = None):
+    try:
+        return index_saved(file_path, "specific", options, digest, move=True)
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
+    finally:
+        cleanup_staging(file_path)
+
+@celery_app.task(bind=True)
+def process_shared_task(self, file_path: str, options: dict = None, digest: str = None):
+    try:
+        return index_saved(file_path, "shared", options, digest, move=True)
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
+    finally:
+        cleanup_staging(file_path)
+
 @celery_app.task(bind=True)
-def process_specific_task(self, file_path: str):
+def process_file_task(self, file_path: str, name: str, options: dict = None, filename: str = None):
     try:
-        documents = process_specific_saved(file_path)
-        if not documents:
-            raise ValueError("No documents extracted")
-        add_to_specific(documents)
-        return {"status": "done", "msg": f"Indexed {file_path}"}
+        return index_saved(file_path, name, options, filename=filename)
     except Exception as e:
         return {"status": "failed", "error": str(e)}
 
 @celery_app.task(bind=True)
-def process_shared_task(self, file_path: str):
+def process_archive_member_task(
+        self,
+        archive_path: str,
+        member: str,
+        name: str,
+        options: dict = None,
+        filename: str = None
+):
     try:
-        documents = process_shared_saved(file_path)
-        if not documents:
-            raise ValueError("No documents extracted")
-        add_to_shared(documents)
-        return {"status": "done", "msg": f"Indexed {file_path}"}
+        staging_dir = STAGING_PATH / (self.request.id or str(uuid.uuid4()))
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        file_path, digest = extract_member(archive_path, member, staging_dir, filename)
+        try:
+            return index_saved(str(file_path), name, options, digest, move=True)
+        finally:
+            cleanup_staging(file_path)
     except Exception as e:
-        return {"status": "failed", "error": str(e)}
\ No newline at end of file
+        return {"status": "failed", "error": str(e)}
+
+@celery_app.task(bind=True)
+def cleanup_batch_task(self, archive_path: str):
+    # runs once every file of an archive batch is done
+    cleanup_staging(archive_path)
+
+@celery_app.task(bind=True)
+def rebuild_task(self, name: str):
+    try:
+        return rebuild_collection(name)
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
+
+@celery_app.task(bind=True)
+def reindex_task(self, source: str, name: str, options: dict = None):
+    try:
+        return reindex_source(source, name, options)
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
+
+@celery_app.task(bind=True)
+def backfill_task(self, name: str):
+    try:
+        return backfill_identifiers(name)
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
+
+@worker_ready.connect
+def queue_backfill(**kwargs):
+    # manuals indexed before the identifier index need their rows before the
+    # source filter can find them
+    for name in UPLOAD_PATHS:
+        backfill_task.delay(name)
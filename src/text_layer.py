@@ -0,0 +1,45 @@
+import os
+from pathlib import Path
+import pypdfium2 as pdfium
+
+# pages with fewer extractable characters than this are treated as scanned
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "50"))
+
+def is_pdf(file_path: Path) -> bool:
+    return Path(file_path).suffix.lower() == ".pdf"
+
+def count_pages(file_path: Path) -> int:
+    # other formats Docling reads (DOCX, HTML, ...) have no fixed pages
+    if not is_pdf(file_path):
+        return 0
+    pdf = pdfium.PdfDocument(str(file_path))
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+def page_text_chars(file_path: Path) -> list[int]:
+    pdf = pdfium.PdfDocument(str(file_path))
+    try:
+        chars = []
+        for page in pdf:
+            textpage = page.get_textpage()
+            chars.append(len(textpage.get_text_range().strip()))
+            textpage.close()
+            page.close()
+        return chars
+    finally:
+        pdf.close()
+
+def scanned_pages(file_path: Path) -> list[bool]:
+    return [chars < TEXT_LAYER_MIN_CHARS for chars in page_text_chars(file_path)]
+
+def page_runs(flags: list[bool]) -> list[tuple[int, int, bool]]:
+    """Group consecutive pages with the same flag into 1-based (start, end, flag) runs."""
+    runs = []
+    for page_no, flag in enumerate(flags, start=1):
+        if runs and runs[-1][2] == flag:
+            runs[-1] = (runs[-1][0], page_no, flag)
+        else:
+            runs.append((page_no, page_no, flag))
+    return runs
@@ -0,0 +1,16 @@
+from pathlib import Path
+import shutil
+import tempfile
+
+from src import config
+
+# modules open their SQLite files and version counters on import, so point
+# them at a scratch directory before any test module imports them
+TEST_DATA_PATH = Path(tempfile.mkdtemp(prefix="bim-tests-"))
+config.CHROMA_PATH = TEST_DATA_PATH / "chroma_db"
+config.CACHE_PATH = TEST_DATA_PATH / "cache"
+config.CHROMA_PATH.mkdir()
+config.CACHE_PATH.mkdir()
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_DATA_PATH, ignore_errors=True)
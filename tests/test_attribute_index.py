@@ -0,0 +1,68 @@
+from src.attribute_index import extract_cells, find_matches, label_key, labels_match
+
+def test_extract_cells_markdown_kv():
+    text = (
+        "### Table 1\n"
+        "- **Rated Load (kg)**: LF1101=500; LF1102=800\n"
+        "- **Row 2**: Model=EXDN; Weight=20 kg\n"
+        "- **Motor**:"
+    )
+    assert extract_cells(text) == [
+        ("Rated Load (kg)", "LF1101", "500"),
+        ("Rated Load (kg)", "LF1102", "800"),
+        ("", "Model", "EXDN"),
+        ("", "Weight", "20 kg"),
+    ]
+
+def test_extract_cells_docling_triplets():
+    text = "Rated speed, Value = 1.5 m/s. Motor power, Value = 2.2 kW."
+    assert extract_cells(text) == [
+        ("Rated speed", "Value", "1.5 m/s"),
+        ("Motor power", "Value", "2.2 kW"),
+    ]
+
+def test_extract_cells_ignores_prose():
+    assert extract_cells("The unit is installed indoors. Keep it dry.") == []
+
+def test_opposite_qualifiers_do_not_match():
+    assert not labels_match("Max Operating Pressure", "Min Operating Pressure")
+    assert not labels_match("Max Operating Pressure", "Operating Pressure")
+
+def test_labels_match_ignores_units_brackets_order_and_plurals():
+    assert labels_match("rated load", "Rated Load (kg)")
+    assert labels_match("Max Operating Pressure", "Operating Pressure Max [bar]")
+    assert labels_match("Weight", "Weight kg")
+    assert labels_match("Dimensions", "dimension")
+
+def test_label_key_of_units_only_is_empty():
+    assert label_key("(mm)") == ""
+    assert not labels_match("kg", "kg")
+
+def weight_cells(*cells):
+    return lambda sources, key: [
+        {
+            "collection": "specific", "source": "a.pdf", "row_label": row, "col_label": col,
+            "value": value, "pages": "[2]", "row_key": label_key(row), "col_key": label_key(col),
+        }
+        for row, col, value in cells
+    ]
+
+def test_find_matches_trusts_the_model_column(monkeypatch):
+    monkeypatch.setattr("src.attribute_index.attributes_for", weight_cells(
+        ("Weight", "EXDN2", "20 kg"),
+        ("Weight", "EXDN4", "25 kg"),
+    ))
+    matches = find_matches({"a.pdf"}, "Weight", "EXDN2")
+    assert [(m["value"], m["confidence"]) for m in matches] == [("20 kg", 100)]
+
+def test_find_matches_discounts_rows_without_a_model(monkeypatch):
+    monkeypatch.setattr("src.attribute_index.attributes_for", weight_cells(("", "Weight", "20 kg")))
+    matches = find_matches({"a.pdf"}, "Weight", "EXDN2")
+    assert [(m["value"], m["confidence"]) for m in matches] == [("20 kg", 90)]
+
+def test_find_matches_skips_unchecked_rows_of_multi_model_tables(monkeypatch):
+    monkeypatch.setattr("src.attribute_index.attributes_for", weight_cells(
+        ("", "Weight", "20 kg"),
+        ("", "Weight", "25 kg"),
+    ))
+    assert find_matches({"a.pdf"}, "Weight", "EXDN2") == []
@@ -0,0 +1,17 @@
+import pytest
+
+from src.bulk_service import source_names
+
+def test_source_names_keep_unique_file_names():
+    assert source_names(["a/one.pdf", "b/two.pdf"]) == ["one.pdf", "two.pdf"]
+
+def test_source_names_prefix_repeated_file_names():
+    assert source_names(["a/manual.pdf", "b/manual.pdf", "c/other.pdf"]) == [
+        "a_manual.pdf",
+        "b_manual.pdf",
+        "other.pdf",
+    ]
+
+def test_source_names_reject_names_that_still_collide():
+    with pytest.raises(ValueError, match="a_manual.pdf"):
+        source_names(["a/manual.pdf", "a_manual.pdf", "b/manual.pdf"])
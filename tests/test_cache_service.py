@@ -0,0 +1,42 @@
+from src.cache_service import DiskBackend, MemoryBackend, QueryCache, bump_version, get_version
+
+def test_keys_ignore_case_and_spacing():
+    cache = QueryCache("test-keys")
+    assert cache.make_key("Daikin", " FTXM 35 ") == cache.make_key("daikin", "ftxm  35")
+    assert cache.make_key("Daikin", "FTXM35") != cache.make_key("Daikin", "FTXM36")
+
+def test_keys_change_with_the_collection_version():
+    cache = QueryCache("test-versions")
+    before = cache.make_key("Daikin", "FTXM35")
+    version = get_version("specific")
+    assert bump_version("specific") == version + 1
+    assert cache.make_key("Daikin", "FTXM35") != before
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_size=2)
+    backend.set("a", 1, ttl=60)
+    backend.set("b", 2, ttl=60)
+    backend.get("a")
+    backend.set("c", 3, ttl=60)
+    assert (backend.get("a"), backend.get("b"), backend.get("c")) == (1, None, 3)
+
+def test_memory_backend_expires_entries():
+    backend = MemoryBackend(max_size=2)
+    backend.set("a", 1, ttl=-1)
+    assert backend.get("a") is None
+
+def test_disk_backend_round_trip_and_eviction():
+    backend = DiskBackend("test-disk", max_size=2)
+    backend.set("a", {"answer": "500 kg"}, ttl=60)
+    backend.set("b", "x", ttl=60)
+    backend.set("c", "y", ttl=60)
+    assert backend.get("c") == "y"
+    assert [backend.get(key) is None for key in ("a", "b", "c")].count(True) == 1
+
+def test_query_cache_counts_hits_and_misses():
+    cache = QueryCache("test-counts")
+    key = cache.make_key("question")
+    assert cache.get(key) is None
+    cache.set(key, "answer")
+    assert cache.get(key) == "answer"
+    assert (cache.hits, cache.misses) == (1, 1)
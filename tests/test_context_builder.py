@@ -0,0 +1,47 @@
+import pytest
+
+from src import context_builder
+from src.context_builder import SHARED_HEADER, SPECIFIC_HEADER, build_context
+
+class WordTokenizer:
+    """One token per whitespace-separated word."""
+
+    def encode(self, text, add_special_tokens=False):
+        return text.split()
+
+    def decode(self, ids):
+        return " ".join(ids)
+
+@pytest.fixture(autouse=True)
+def word_tokenizer(monkeypatch):
+    monkeypatch.setattr(context_builder, "get_tokenizer", lambda: WordTokenizer())
+
+def hit(cid, text, source="a.pdf", pages="[1]"):
+    return {"id": cid, "document": text, "metadata": {"source": source, "pages": pages}}
+
+def test_nothing_found():
+    assert build_context([], [], ["Weight"]) == "Not Found"
+
+def test_only_rows_mentioning_the_attribute_are_kept():
+    text = "- **Weight**: Value=20 kg\n- **Colour**: Value=red"
+    context = build_context([hit("1", text)], [], ["weight"])
+    assert "Weight" in context
+    assert "Colour" not in context
+
+def test_chunk_without_mention_is_kept_whole():
+    text = "- **Colour**: Value=red"
+    assert text in build_context([hit("1", text)], [], ["weight"])
+
+def test_specific_before_shared_and_no_duplicates():
+    specific = [hit("1", "Weight 20 kg")]
+    shared = [hit("1", "Weight 20 kg"), hit("2", "Weight 25 kg", source="b.pdf")]
+    context = build_context(specific, shared, ["weight"])
+    assert context.index(SPECIFIC_HEADER) < context.index("20 kg") < context.index(SHARED_HEADER)
+    assert context.count("20 kg") == 1
+    assert "25 kg" in context
+
+def test_packing_stops_at_the_budget():
+    hits = [hit(str(i), "weight " * 50) for i in range(5)]
+    context = build_context(hits, [], ["weight"], budget=120)
+    assert len(context.split()) <= 120
+    assert context.count("Ref:") == 2
@@ -0,0 +1,31 @@
+from src.embedding_cache import EmbeddingCache
+
+def test_put_and_get(tmp_path):
+    cache = EmbeddingCache("model", tmp_path)
+    cache.put_many(["a", "b"], [[1, 2], [3, 4]])
+    assert cache.get_many(["a", "b", "c"]) == {"a": [1.0, 2.0], "b": [3.0, 4.0]}
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_known_and_repeated_ids_are_stored_once(tmp_path):
+    cache = EmbeddingCache("model", tmp_path)
+    cache.put_many(["a", "a"], [[1, 2], [7, 7]])
+    cache.put_many(["a", "b"], [[9, 9], [3, 4]])
+    assert cache.get_many(["a", "b"]) == {"a": [1.0, 2.0], "b": [3.0, 4.0]}
+    assert cache.vectors_path.stat().st_size == 2 * 2 * 4
+
+def test_rows_of_an_uncommitted_writer_are_overwritten(tmp_path):
+    cache = EmbeddingCache("model", tmp_path)
+    cache.put_many(["a"], [[1, 2]])
+    # a writer that died between appending and committing its index rows
+    with open(cache.vectors_path, "ab") as f:
+        f.write(b"\0" * 12)
+    cache.put_many(["b"], [[3, 4]])
+    assert cache.get_many(["b"]) == {"b": [3.0, 4.0]}
+    assert cache.vectors_path.stat().st_size == 2 * 2 * 4
+
+def test_rows_appended_by_another_process_are_read(tmp_path):
+    cache = EmbeddingCache("model", tmp_path)
+    cache.put_many(["a"], [[1, 2]])
+    assert cache.get_many(["a"]) == {"a": [1.0, 2.0]}
+    EmbeddingCache("model", tmp_path).put_many(["b"], [[3, 4]])
+    assert cache.get_many(["b"]) == {"b": [3.0, 4.0]}
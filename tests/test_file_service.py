@@ -0,0 +1,66 @@
+import os
+
+from src.file_service import plan_segments, save_to, split_range
+
+def test_split_range_into_windows():
+    assert split_range(1, 120, 50) == [(1, 50), (51, 100), (101, 120)]
+    assert split_range(7, 9, 50) == [(7, 9)]
+
+def test_split_range_on_window_boundary():
+    assert split_range(1, 100, 50) == [(1, 50), (51, 100)]
+
+def test_plan_segments_follow_scanned_runs(monkeypatch):
+    monkeypatch.setattr("src.file_service.PAGE_WINDOW", 2)
+    monkeypatch.setattr("src.file_service.scanned_pages", lambda path: [False, False, False, True])
+    assert plan_segments("manual.pdf", "auto") == [
+        ((1, 2), False),
+        ((3, 3), False),
+        ((4, 4), True),
+    ]
+
+def test_plan_segments_without_ocr_probe(monkeypatch):
+    monkeypatch.setattr("src.file_service.PAGE_WINDOW", 50)
+    monkeypatch.setattr("src.file_service.count_pages", lambda path: 120)
+    assert plan_segments("manual.pdf", "always") == [
+        ((1, 50), True),
+        ((51, 100), True),
+        ((101, 120), True),
+    ]
+
+def test_plan_segments_of_other_formats():
+    assert plan_segments("manual.docx", "auto") == []
+
+def upload_dirs(tmp_path):
+    source = tmp_path / "staging" / "a.pdf"
+    source.parent.mkdir()
+    source.write_bytes(b"manual")
+    target_dir = tmp_path / "upload"
+    target_dir.mkdir()
+    return source, target_dir
+
+def test_save_to_moves_owned_files(tmp_path):
+    source, target_dir = upload_dirs(tmp_path)
+    target = save_to(str(source), target_dir, move=True, filename="b.pdf")
+    assert target == target_dir / "b.pdf"
+    assert target.read_bytes() == b"manual"
+    assert not source.exists()
+
+def test_save_to_links_files_it_does_not_own(tmp_path):
+    source, target_dir = upload_dirs(tmp_path)
+    (target_dir / "a.pdf").write_bytes(b"older revision")
+    target = save_to(str(source), target_dir)
+    assert target.read_bytes() == b"manual"
+    assert target.samefile(source)
+    assert sorted(p.name for p in target_dir.iterdir()) == ["a.pdf"]
+
+def test_save_to_copies_across_filesystems(tmp_path, monkeypatch):
+    source, target_dir = upload_dirs(tmp_path)
+
+    def cross_device(*args):
+        raise OSError("cross-device link")
+
+    monkeypatch.setattr(os, "link", cross_device)
+    target = save_to(str(source), target_dir)
+    assert target.read_bytes() == b"manual"
+    assert not target.samefile(source)
+    assert source.exists()
@@ -0,0 +1,36 @@
+from src.identifiers import extract_identifiers, is_model, query_identifiers
+
+def test_model_numbers_are_normalized():
+    found = extract_identifiers("Models FTXM-35R and EXDN/2 only.")
+    assert {"FTXM35R", "EXDN2"} <= found["model"]
+
+def test_spaced_model_numbers_are_joined():
+    assert "FTXM35R" in extract_identifiers("Unit FTXM 35 R outdoor")["model"]
+
+def test_tokens_are_not_joined_across_lines_or_punctuation():
+    found = extract_identifiers("FTXM\n35R, GX 100")["model"]
+    assert "FTXM35R" not in found
+    assert "35RGX" not in found
+    assert "GX100" in found
+
+def test_models_mix_letters_and_digits():
+    assert is_model("FX1")
+    assert not is_model("4500")
+    assert not is_model("MODEL")
+    found = extract_identifiers("Series 4500, rated 500 kg, Model 12")["model"]
+    assert not found & {"4500", "500KG", "MODEL12"}
+
+def test_only_capitalized_words_are_kept():
+    found = extract_identifiers("Daikin outdoor UNIT")["word"]
+    assert {"daikin", "unit"} <= found
+    assert "outdoor" not in found
+
+def test_query_identifiers():
+    assert query_identifiers("3M Company", "FTXM-35") == {
+        "model": ["3M"],
+        "word": ["company"],
+        "model_prefix": ["FTXM35"],
+    }
+
+def test_short_model_numbers_match_exactly():
+    assert query_identifiers("", "FX1") == {"model": ["FX1"], "word": [], "model_prefix": []}
@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import pytest
+
+from src.ingest_pipeline import IngestJob
+
+def make_job():
+    return IngestJob(Path("FTXM35R manual.pdf"), "specific", {})
+
+def test_job_finishes_once_every_batch_is_written():
+    job = make_job()
+    job.converted()
+    job.emitted()
+    job.emitted()
+    job.emitted(done=True)
+    job.written(["a", "b"], 2)
+    job.converted(done=True)
+    assert not job.future.done()
+    job.written(["b", "c"], 1)
+    result = job.future.result(timeout=0)
+    assert result["chunk_ids"] == ["a", "b", "c"]
+    assert result["new_chunks"] == 3
+    assert "FTXM35R" in result["identifiers"]["model"]
+
+def test_job_waits_for_every_converted_segment():
+    job = make_job()
+    job.converted()
+    job.converted()
+    job.converted(done=True)
+    job.emitted(done=True)
+    assert not job.future.done()
+    job.emitted(done=True)
+    assert job.future.done()
+
+def test_failure_is_kept():
+    job = make_job()
+    job.fail(ValueError("conversion failed"))
+    job.fail(RuntimeError("later"))
+    job.converted(done=True)
+    assert job.failed
+    with pytest.raises(ValueError):
+        job.future.result(timeout=0)
@@ -0,0 +1,35 @@
+import hashlib
+import io
+
+from src.manifest_service import forget_document, record_document, referenced_chunk_ids, write_stream
+
+def test_shared_chunks_stay_referenced_until_the_last_document_goes():
+    record_document("sha-a", "refs", "a.pdf", ["c1", "c2"])
+    record_document("sha-b", "refs", "b.pdf", ["c2", "c3"])
+    assert referenced_chunk_ids("refs", ["c1", "c2", "c4"]) == {"c1", "c2"}
+    forget_document("sha-a", "refs")
+    assert referenced_chunk_ids("refs", ["c1", "c2"]) == {"c2"}
+    forget_document("sha-b", "refs")
+    assert referenced_chunk_ids("refs", ["c2", "c3"]) == set()
+
+def test_recording_a_document_again_replaces_its_chunks():
+    record_document("sha-a", "refs-again", "a.pdf", ["c1", "c2"])
+    record_document("sha-a", "refs-again", "a.pdf", ["c2", "c3"])
+    assert referenced_chunk_ids("refs-again", ["c1", "c2", "c3"]) == {"c2", "c3"}
+
+def test_references_are_per_collection():
+    record_document("sha-a", "refs-one", "a.pdf", ["c1"])
+    assert referenced_chunk_ids("refs-other", ["c1"]) == set()
+
+def test_lookups_are_batched(monkeypatch):
+    monkeypatch.setattr("src.manifest_service.MAX_PARAMS", 2)
+    ids = [f"c{i}" for i in range(5)]
+    record_document("sha-a", "refs-batched", "a.pdf", ids)
+    assert referenced_chunk_ids("refs-batched", ids + ids) == set(ids)
+
+def test_write_stream_hashes_what_it_writes(tmp_path):
+    data = b"manual" * 1000
+    target = tmp_path / "a.pdf"
+    assert write_stream(io.BytesIO(data), target, block_size=64) == hashlib.sha256(data).hexdigest()
+    assert target.read_bytes() == data
+    assert [p.name for p in tmp_path.iterdir()] == ["a.pdf"]
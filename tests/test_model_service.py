@@ -0,0 +1,29 @@
+import pytest
+
+from src.model_service import TokenStreamer, parse_batch_answer, trim_completion
+
+def test_parse_batch_answer_matches_labels_loosely():
+    text = (
+        "- **Rated Load**: 500 kg (95%) [Ref: a.pdf page 2]\n"
+        "* weight: 20 kg (80%) [Ref: a.pdf page 3]\n"
+        "Something else entirely"
+    )
+    assert parse_batch_answer(text, ["Rated Load", "Weight", "Voltage"]) == {
+        "Rated Load": "500 kg (95%) [Ref: a.pdf page 2]",
+        "Weight": "20 kg (80%) [Ref: a.pdf page 3]",
+    }
+
+def test_parse_batch_answer_empty_value_is_not_found():
+    assert parse_batch_answer("Voltage:", ["Voltage"]) == {"Voltage": "Not Found"}
+
+def test_trim_completion_keeps_first_stop_token():
+    assert trim_completion([5, 6, 2, 0, 0], [2, 3]) == [5, 6, 2]
+    assert trim_completion([5, 3, 2], [2, 3]) == [5, 3]
+
+def test_trim_completion_without_stop_token():
+    assert trim_completion([5, 6, 7], [2]) == [5, 6, 7]
+
+def test_token_streamer_times_out():
+    streamer = TokenStreamer(timeout=0.01)
+    with pytest.raises(TimeoutError):
+        list(streamer)
@@ -0,0 +1,44 @@
+from src.prefix_cache import PrefixCache
+
+def make_cache(monkeypatch, max_bytes=1024):
+    cache = PrefixCache(max_bytes)
+    prefilled = []
+
+    def prefill(model, prefix_ids):
+        prefilled.append(list(prefix_ids))
+        return {"prefix": list(prefix_ids)}
+
+    monkeypatch.setattr(cache, "_prefill", prefill)
+    return cache, prefilled
+
+def test_prefix_must_start_the_prompt(monkeypatch):
+    cache, prefilled = make_cache(monkeypatch)
+    assert cache.lookup(None, [1, 2, 3], [2, 3]) is None
+    assert cache.lookup(None, [1, 2, 3], []) is None
+    assert prefilled == []
+
+def test_prefix_must_leave_a_token_to_generate(monkeypatch):
+    cache, prefilled = make_cache(monkeypatch)
+    assert cache.lookup(None, [1, 2], [1, 2]) is None
+    assert prefilled == []
+
+def test_disabled_cache_never_prefills(monkeypatch):
+    cache, prefilled = make_cache(monkeypatch, max_bytes=0)
+    assert cache.lookup(None, [1, 2, 3], [1, 2]) is None
+    assert prefilled == []
+
+def test_hit_returns_a_private_copy(monkeypatch):
+    cache, prefilled = make_cache(monkeypatch)
+    first = cache.lookup(None, [1, 2, 3], [1, 2])
+    first["prefix"].append(99)
+    second = cache.lookup(None, [1, 2, 4], [1, 2])
+    assert second == {"prefix": [1, 2]}
+    assert prefilled == [[1, 2]]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_applies_without_prefilling(monkeypatch):
+    cache, prefilled = make_cache(monkeypatch)
+    assert cache.applies([1, 2, 3], [1, 2])
+    assert not cache.applies([1, 2], [1, 2])
+    assert not cache.applies([1, 2, 3], [2])
+    assert prefilled == []
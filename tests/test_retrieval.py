@@ -0,0 +1,12 @@
+from src.chroma_service import fuse_rankings
+
+def test_fuse_rankings_favours_agreement():
+    vector = ["a", "b", "c"]
+    lexical = ["a", "d", "c"]
+    assert fuse_rankings([vector, lexical], 2) == ["a", "c"]
+
+def test_fuse_rankings_single_ranking_keeps_order():
+    assert fuse_rankings([["x", "y", "z"]], 5) == ["x", "y", "z"]
+
+def test_fuse_rankings_of_nothing():
+    assert fuse_rankings([[], []], 3) == []
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+from src.scheduler import BatchScheduler
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.001)
+
+def test_submit_returns_own_result():
+    scheduler = BatchScheduler(lambda requests: [r.prefill_ids[::-1] for r in requests], window_ms=1)
+    assert scheduler.submit([1, 2, 3], [1], 8) == [3, 2, 1]
+
+def test_concurrent_requests_share_a_batch():
+    batches = []
+    release = threading.Event()
+
+    def generate_batch(requests):
+        batches.append(len(requests))
+        # hold the first batch so the others queue up behind it
+        release.wait(5)
+        return [request.prefill_ids[::-1] for request in requests]
+
+    scheduler = BatchScheduler(generate_batch, window_ms=20, max_batch=4)
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [pool.submit(scheduler.submit, [i, i + 1], [], 4) for i in range(5)]
+        wait_until(lambda: batches and batches[0] + scheduler._queue.qsize() == 5)
+        release.set()
+        assert [future.result(5) for future in futures] == [[i + 1, i] for i in range(5)]
+    assert sum(batches) == 5
+    assert max(batches) <= 4
+    assert len(batches) < 5
+    assert scheduler.stats()["requests"] == 5
+
+def test_failure_reaches_every_request_of_the_batch():
+    release = threading.Event()
+
+    def generate_batch(requests):
+        release.wait(5)
+        raise RuntimeError("out of memory")
+
+    scheduler = BatchScheduler(generate_batch, window_ms=20)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(scheduler.submit, [i], [], 4) for i in range(2)]
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError, match="out of memory"):
+                future.result(5)
+
+def test_scheduler_keeps_running_after_a_failure():
+    calls = []
+
+    def generate_batch(requests):
+        calls.append(len(requests))
+        if len(calls) == 1:
+            raise ValueError("bad batch")
+        return [[0] for _ in requests]
+
+    scheduler = BatchScheduler(generate_batch, window_ms=1)
+    with pytest.raises(ValueError):
+        scheduler.submit([1], [], 1)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        assert list(pool.map(lambda ids: scheduler.submit(ids, [], 1), [[1], [2]])) == [[0], [0]]
+
+def test_failed_batch_ends_streams():
+    class Streamer:
+        ended = False
+
+        def end(self):
+            self.ended = True
+
+    def generate_batch(requests):
+        raise RuntimeError("out of memory")
+
+    scheduler = BatchScheduler(generate_batch, window_ms=20)
+    streamer = Streamer()
+    future = scheduler.submit_async([1], [], 4, streamer)
+    with pytest.raises(RuntimeError):
+        future.result(5)
+    assert streamer.ended
@@ -0,0 +1,16 @@
+from src.text_layer import count_pages, page_runs
+
+def test_page_runs_groups_consecutive_pages():
+    assert page_runs([False, False, True, True, False]) == [
+        (1, 2, False),
+        (3, 4, True),
+        (5, 5, False),
+    ]
+
+def test_page_runs_of_empty_document():
+    assert page_runs([]) == []
+
+def test_count_pages_of_other_formats(tmp_path):
+    path = tmp_path / "manual.docx"
+    path.write_bytes(b"not a pdf")
+    assert count_pages(path) == 0